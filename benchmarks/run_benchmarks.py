@@ -0,0 +1,436 @@
+"""
+Benchmarks of the data processing and evaluation stages on synthetic workloads.
+
+Every benchmark runs over a range of problem sizes and reports the best wall time of a few
+repetitions, the throughput and the peak memory traced by tracemalloc. A repetition calls the
+workload as many times as it takes to last at least --min-time seconds, so fast workloads are
+timed over many calls. Results can be saved as
+a baseline and later runs compared against it:
+
+    python benchmarks/run_benchmarks.py --save benchmarks/baselines/before.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baselines/before.json
+
+Run from the repository root. Workloads are written to a temporary directory, which is also
+the working directory while they run, so nothing in data/ is touched.
+
+The harness benchmarks the tree it is placed in, and falls back to the older equivalent of an
+API the tree does not have yet, so an earlier commit can be measured with the same workloads:
+
+    git worktree add /tmp/before <commit>
+    cp benchmarks/run_benchmarks.py /tmp/before/benchmarks/
+    (cd /tmp/before && python benchmarks/run_benchmarks.py --save before.json)
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR / 'src' / 'data'))
+sys.path.insert(0, str(ROOT_DIR / 'src' / 'models'))
+
+MIN_TIME = 0.2              # Minimum duration of one timed repetition (s)
+MIN_COMPARE_SECONDS = 0.01  # Shorter times are too noisy to compare with the baseline (s)
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+from generate_simulated_data import calculate_pulse_counts, generate_flow_data
+from extract_pulse_data import extract_pulse_data
+from utils import EncodingDictManager
+from encode_additional_dataset import DataEncoder
+from evaluate import calculate_model_performance, merge_evaluation_with_model_output
+try:
+    from pulse_hourly import save_pulse_hourly
+except ImportError:  # Trees without the .npy sidecar parse the text column
+    save_pulse_hourly = None
+
+class Unavailable(Exception):
+    """Raised by prepare when the benchmarked tree cannot run a problem size."""
+
+class Benchmark:
+    """
+    A workload over a range of problem sizes.
+
+    prepare(workdir, **params) writes the inputs once and returns a context; run(context) is the
+    timed call. reset(context), if given, restores the starting state before every repetition
+    without being timed. units(params) is the number of items processed, for the throughput.
+    """
+
+    def __init__(self, name: str, unit: str, sizes: Dict[str, List[dict]], prepare: Callable[..., dict],
+                 run: Callable[[dict], Any], units: Callable[[dict], int],
+                 reset: Optional[Callable[[dict], None]] = None):
+        self.name = name
+        self.unit = unit
+        self.sizes = sizes
+        self.prepare = prepare
+        self.run = run
+        self.units = units
+        self.reset = reset
+
+def _quiet(function: Callable, *args, **kwargs):
+    """Call a function with its progress prints suppressed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def _batch(manager: EncodingDictManager):
+    """The manager's batch, or no batching on trees that save after every new code."""
+    return manager.batch() if hasattr(manager, 'batch') else contextlib.nullcontext()
+
+# calculate_pulse_counts / generate_flow_data: simulated duration in seconds
+
+def prepare_pulse_counts(workdir: Path, duration: int) -> dict:
+    rng = np.random.default_rng(0)
+    return {'flow_rates': rng.gamma(0.5, 0.2, duration)}
+
+def prepare_flow_data(workdir: Path, duration: int) -> dict:
+    return {'duration': duration}
+
+# extract_pulse_data: raw rows and fraction of devices requested
+
+def random_payload(rng: np.random.Generator, pulse_date: str) -> str:
+    """A MeterReportPulseInfo message with a few runs of per-minute pulse counts."""
+    segments = []
+    for start in np.sort(rng.choice(1440, size=8, replace=False)):
+        counts = rng.integers(0, 5, size=rng.integers(1, 15))
+        segments.append({'t': f"{start // 60:02d}:{start % 60:02d}", 'd': '|'.join(map(str, counts)) + '|'})
+    return json.dumps({'Type': 'MeterReportPulseInfo', 'data': segments, 'FinalFlag': 0,
+                       'Result': 'SUCCESS', 'pulseDate': pulse_date}, separators=(',', ':'))
+
+def prepare_extract(workdir: Path, rows: int, match_fraction: float) -> dict:
+    rng = np.random.default_rng(0)
+    n_devices = max(rows // 20, 1)
+    device_ids = np.array([f"{80000000 + i}" for i in range(n_devices)])
+    dates = [f"2401{day:02d}" for day in range(1, 11)]
+
+    row_devices = device_ids[rng.integers(0, n_devices, rows)]
+    row_dates = rng.choice(dates, rows)
+    raw = pd.DataFrame({
+        '表号': row_devices,
+        '数据': [random_payload(rng, date) for date in row_dates],
+        '备注': '其他'
+    })
+    raw_file = workdir / 'raw.csv'
+    raw.to_csv(raw_file, index=False, encoding='gbk')
+
+    requested = device_ids[:int(round(n_devices * match_fraction))]
+    device_dates = {device_id: [dates[i % len(dates)]] for i, device_id in enumerate(requested)}
+    return {'raw_file': str(raw_file), 'device_dates': device_dates, 'output_file': str(workdir / 'pulse.csv')}
+
+def run_extract(context: dict):
+    _quiet(extract_pulse_data, context['raw_file'], context['device_dates'], context['output_file'])
+
+def reset_encoding_dicts(context: dict):
+    """Start from empty encoding dictionaries in the working directory."""
+    Path('data/interim/encoding_dicts.json').unlink(missing_ok=True)
+    Path('data/interim/encoding_dicts.json.log').unlink(missing_ok=True)
+
+# EncodingDictManager.get_or_create_encoding: number of new IDs
+
+def prepare_encoding(workdir: Path, new_ids: int) -> dict:
+    return {'values': [f"{80000000 + i}" for i in range(new_ids)]}
+
+def run_encoding(context: dict):
+    manager = EncodingDictManager()
+    with _batch(manager):
+        for value in context['values']:
+            manager.get_or_create_encoding('device_id', value)
+
+def run_encoding_unbatched(context: dict):
+    manager = EncodingDictManager()
+    for value in context['values']:
+        manager.get_or_create_encoding('device_id', value)
+
+# DataEncoder.encode_address: number of addresses
+
+def prepare_addresses(workdir: Path, addresses: int) -> dict:
+    rng = np.random.default_rng(0)
+    communities = [f"阳光花园{i}" for i in range(max(addresses // 50, 1))]
+    values = [
+        f"{communities[rng.integers(len(communities))]}{rng.integers(1, 4)}期{rng.integers(1, 30)}栋"
+        f"{rng.integers(1, 5)}单元{rng.integers(1, 33)}层{rng.integers(101, 3305)}室"
+        for _ in range(addresses)
+    ]
+    return {'addresses': values}
+
+def run_encode_address(context: dict):
+    encoder = DataEncoder()
+    with _batch(encoder.encoding_manager):
+        for address in context['addresses']:
+            encoder.encode_address(address)
+
+def run_encode_addresses(context: dict):
+    encoder = DataEncoder()
+    addresses = pd.Series(context['addresses'], dtype=object)
+    with _batch(encoder.encoding_manager):
+        if hasattr(encoder, 'encode_addresses'):
+            encoder.encode_addresses(addresses)
+        else:
+            addresses.map(encoder.encode_to_string)
+
+# merge_evaluation_with_model_output: number of reports
+
+def prepare_merge(workdir: Path, reports: int) -> dict:
+    rng = np.random.default_rng(0)
+    devices = np.array([f"D{i:03d}" for i in range(1, reports + 1)])
+    report_dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 120, reports), unit='D')
+    eval_df = pd.DataFrame({
+        'device_id_encoded': devices,
+        'date_report': report_dates.strftime('%Y/%m/%d'),
+        'label': rng.choice(['LEAKAGE', 'NORMAL'], reports, p=[0.07, 0.93])
+    })
+
+    # Model output for the reported days and the two days before, in scoring order
+    model_dates = np.concatenate([report_dates - pd.Timedelta(days=offset) for offset in (2, 1, 0)])
+    hourly = rng.integers(0, 6, (len(model_dates), 24))
+    model_df = pd.DataFrame({
+        'device_id': np.tile(devices, 3),
+        'date': pd.DatetimeIndex(model_dates).strftime('%Y-%m-%d'),
+        'score_likelihood': rng.uniform(0, 100, len(model_dates)).round(2),
+        'pulse_hourly': [str(row) for row in hourly.tolist()]
+    })
+
+    eval_file, model_file = workdir / 'evaluation.csv', workdir / 'model_output.csv'
+    eval_df.to_csv(eval_file, index=False)
+    model_df.to_csv(model_file, index=False)
+    if save_pulse_hourly:
+        save_pulse_hourly(hourly, str(model_file))
+    return {'eval_file': str(eval_file), 'model_file': str(model_file), 'output_file': str(workdir / 'merged.csv')}
+
+def run_merge(context: dict):
+    _quiet(merge_evaluation_with_model_output, context['eval_file'], context['model_file'], context['output_file'])
+
+# calculate_model_performance: number of evaluated rows and bootstrap resamples
+
+def prepare_performance(workdir: Path, rows: int, n_bootstrap: int) -> dict:
+    # Trees before the path and bootstrap arguments read the merged results from a fixed path
+    legacy = 'path' not in inspect.signature(calculate_model_performance).parameters
+    if legacy and n_bootstrap > 0:
+        raise Unavailable("calculate_model_performance has no bootstrap")
+    rng = np.random.default_rng(0)
+    labels = (rng.random(rows) < 0.07).astype(int)
+    scores = np.clip(rng.normal(40 + 25 * labels, 20), 0, 100).round(2)
+    path = workdir / 'data' / 'results' / 'evaluation_dataset_with_model_output.csv'
+    path.parent.mkdir(parents=True)
+    pd.DataFrame({'label_encoded': labels, 'baseline_model': True, 'proposed_model_40': scores >= 40,
+                  'proposed_model_60': scores >= 60, 'score_by_proposed_model': scores}).to_csv(path, index=False)
+    return {'path': str(path), 'n_bootstrap': n_bootstrap, 'legacy': legacy}
+
+def run_performance(context: dict):
+    if context['legacy']:
+        calculate_model_performance()
+    else:
+        calculate_model_performance(context['path'], n_bootstrap=context['n_bootstrap'])
+
+BENCHMARKS = [
+    Benchmark('calculate_pulse_counts', 'samples',
+              {'small': [{'duration': 3600}],
+               'default': [{'duration': 3600}, {'duration': 86400}, {'duration': 604800}],
+               'large': [{'duration': 86400}, {'duration': 2592000}]},
+              prepare_pulse_counts, lambda context: calculate_pulse_counts(context['flow_rates'], 0.01),
+              lambda params: params['duration']),
+    Benchmark('generate_flow_data', 'seconds',
+              {'small': [{'duration': 3600}],
+               'default': [{'duration': 3600}, {'duration': 86400}],
+               'large': [{'duration': 86400}, {'duration': 604800}]},
+              prepare_flow_data, lambda context: generate_flow_data(context['duration']),
+              lambda params: params['duration']),
+    Benchmark('extract_pulse_data', 'rows',
+              {'small': [{'rows': 5000, 'match_fraction': 0.1}],
+               'default': [{'rows': 50000, 'match_fraction': fraction} for fraction in (0.01, 0.1, 1.0)],
+               'large': [{'rows': 500000, 'match_fraction': fraction} for fraction in (0.01, 0.1)]},
+              prepare_extract, run_extract, lambda params: params['rows'], reset=reset_encoding_dicts),
+    Benchmark('get_or_create_encoding', 'IDs',
+              {'small': [{'new_ids': 1000}],
+               'default': [{'new_ids': 1000}, {'new_ids': 10000}],
+               'large': [{'new_ids': 100000}, {'new_ids': 1000000}]},
+              prepare_encoding, run_encoding, lambda params: params['new_ids'], reset=reset_encoding_dicts),
+    Benchmark('get_or_create_encoding_unbatched', 'IDs',
+              {'small': [{'new_ids': 100}],
+               'default': [{'new_ids': 100}, {'new_ids': 1000}],
+               'large': [{'new_ids': 10000}]},
+              prepare_encoding, run_encoding_unbatched, lambda params: params['new_ids'],
+              reset=reset_encoding_dicts),
+    Benchmark('encode_address', 'addresses',
+              {'small': [{'addresses': 1000}],
+               'default': [{'addresses': 1000}, {'addresses': 10000}],
+               'large': [{'addresses': 100000}]},
+              prepare_addresses, run_encode_address, lambda params: params['addresses'], reset=reset_encoding_dicts),
+    Benchmark('encode_addresses', 'addresses',
+              {'small': [{'addresses': 1000}],
+               'default': [{'addresses': 1000}, {'addresses': 10000}, {'addresses': 100000}],
+               'large': [{'addresses': 1000000}]},
+              prepare_addresses, run_encode_addresses, lambda params: params['addresses'], reset=reset_encoding_dicts),
+    Benchmark('merge_evaluation_with_model_output', 'reports',
+              {'small': [{'reports': 1000}],
+               'default': [{'reports': 1000}, {'reports': 10000}, {'reports': 100000}],
+               'large': [{'reports': 1000000}]},
+              prepare_merge, run_merge, lambda params: params['reports']),
+    Benchmark('calculate_model_performance', 'rows',
+              {'small': [{'rows': 1189, 'n_bootstrap': 0}],
+               'default': [{'rows': 1189, 'n_bootstrap': 0}, {'rows': 1189, 'n_bootstrap': 1000},
+                           {'rows': 100000, 'n_bootstrap': 0}],
+               'large': [{'rows': 1000000, 'n_bootstrap': 0}, {'rows': 100000, 'n_bootstrap': 1000}]},
+              prepare_performance, run_performance, lambda params: params['rows']),
+]
+
+def measure(benchmark: Benchmark, params: dict, repeat: int, min_time: float = MIN_TIME) -> dict:
+    """
+    Time a benchmark at one problem size, then trace its peak memory in one more run.
+
+    Parameters:
+    benchmark (Benchmark): Workload to run.
+    params (dict): Problem size.
+    repeat (int): Number of timed repetitions; the best is kept.
+    min_time (float): Minimum duration of a repetition. A repetition runs the workload until
+        its runs add up to min_time, and is timed as their mean.
+
+    Returns:
+    dict: 'benchmark', 'params', 'seconds', 'loops', 'throughput', 'unit' and 'peak_mb'.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{benchmark.name}_"))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        context = benchmark.prepare(workdir, **params)
+        times = []
+        for _ in range(repeat):
+            loops, total = 0, 0.0
+            while loops == 0 or total < min_time:
+                if benchmark.reset:
+                    benchmark.reset(context)
+                started = time.perf_counter()
+                benchmark.run(context)
+                total += time.perf_counter() - started
+                loops += 1
+            times.append(total / loops)
+
+        # Traced separately, as tracing slows allocations down
+        if benchmark.reset:
+            benchmark.reset(context)
+        tracemalloc.start()
+        benchmark.run(context)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    seconds = min(times)
+    return {
+        'benchmark': benchmark.name,
+        'params': params,
+        'seconds': round(seconds, 6),
+        'loops': loops,
+        'throughput': round(benchmark.units(params) / seconds, 1),
+        'unit': benchmark.unit,
+        'peak_mb': round(peak / 2**20, 2)
+    }
+
+def environment() -> dict:
+    """Machine and library versions the results were measured with."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def result_key(result: dict) -> str:
+    return f"{result['benchmark']}({', '.join(f'{k}={v}' for k, v in sorted(result['params'].items()))})"
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> bool:
+    """
+    Print the change of every result against a saved baseline.
+
+    Times below MIN_COMPARE_SECONDS in both runs are printed but not reported as regressions.
+
+    Returns:
+    bool: Whether no result is slower or uses more memory than the baseline by more than tolerance.
+    """
+    previous = {result_key(result): result for result in baseline['results']}
+    print(f"\nCompared with baseline from {baseline['environment']['date']} "
+          f"(commit {baseline['environment']['commit'] or 'unknown'}):")
+    ok = True
+    for result in results:
+        key = result_key(result)
+        if key not in previous:
+            print(f"  {key}: not in baseline")
+            continue
+        time_ratio = result['seconds'] / previous[key]['seconds']
+        memory_ratio = result['peak_mb'] / previous[key]['peak_mb'] if previous[key]['peak_mb'] else 1.0
+        too_short = max(result['seconds'], previous[key]['seconds']) < MIN_COMPARE_SECONDS
+        regressed = (time_ratio > 1 + tolerance and not too_short) or memory_ratio > 1 + tolerance
+        ok &= not regressed
+        note = f" (under {MIN_COMPARE_SECONDS * 1000:.0f} ms, time not compared)" if too_short else ""
+        print(f"  {'✗' if regressed else '✓'} {key}: time x{time_ratio:.2f}, peak memory x{memory_ratio:.2f}{note}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic workloads.")
+    parser.add_argument('benchmarks', nargs='*', help="Benchmarks to run (default: all)")
+    parser.add_argument('--size', choices=['small', 'default', 'large'], default='default', help="Problem sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed repetitions per problem size")
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help="Minimum seconds per repetition; fast workloads are looped until they last this long")
+    parser.add_argument('--save', default=None, help="Save the results as a baseline JSON file")
+    parser.add_argument('--compare', default=None, help="Baseline JSON file to compare the results with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Relative slowdown or memory growth reported as a regression")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks")
+    args = parser.parse_args()
+
+    if args.list:
+        for benchmark in BENCHMARKS:
+            print(f"{benchmark.name}: {benchmark.sizes[args.size]}")
+        sys.exit(0)
+
+    selected = [benchmark for benchmark in BENCHMARKS if not args.benchmarks or benchmark.name in args.benchmarks]
+    unknown = set(args.benchmarks) - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = []
+    for benchmark in selected:
+        for params in benchmark.sizes[args.size]:
+            try:
+                result = measure(benchmark, params, args.repeat, args.min_time)
+            except Unavailable as e:
+                print(f"{result_key({'benchmark': benchmark.name, 'params': params})}: skipped, {e}")
+                continue
+            results.append(result)
+            print(f"{result_key(result)}: {result['seconds']:.4f}s, "
+                  f"{result['throughput']:,.0f} {result['unit']}/s, peak {result['peak_mb']:.1f} MB")
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'size': args.size, 'results': results}, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
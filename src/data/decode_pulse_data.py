@@ -0,0 +1,189 @@
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from itertools import chain
+from typing import Tuple
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_HOUR = 60
+HOURS_PER_DAY = 24
+
+# A MeterReportPulseInfo payload looks like
+#   {"Type":"MeterReportPulseInfo","data":[{"t":"09:07","d":"1|0|1|"}, ...],"pulseDate":"240101"}
+# where every segment starts at minute "t" and "d" holds one pulse count per consecutive minute.
+SEGMENT_PATTERN = r'"t":"\d\d:\d\d","d":"[^"]*"'
+PULSE_DATE_PATTERN = r'"pulseDate"\s*:\s*"(?P<pulse_date>\d{6})"'
+_SEGMENT_RE = re.compile(SEGMENT_PATTERN)
+
+# Fixed offsets inside a matched segment: '"t":"HH:MM","d":"<runs>"'
+_TIME_SLICE = slice(5, 10)
+_RUNS_SLICE = slice(17, -1)
+
+def extract_pulse_dates(payloads: pd.Series) -> pd.Series:
+    """Extract the pulseDate field from raw payload strings without parsing the JSON.
+
+    Args:
+        payloads (pd.Series): Raw MeterReportPulseInfo JSON strings
+
+    Returns:
+        pd.Series: pulseDate strings (yymmdd), NaN where the field is missing
+    """
+    return payloads.astype(str).str.extract(PULSE_DATE_PATTERN, expand=False)
+
+def decode_pulse_matrix(payloads: pd.Series, return_last_minute: bool = False) -> np.ndarray | Tuple[np.ndarray, np.ndarray]:
+    """Decode a batch of pulse payloads into a dense device-day x minute matrix.
+
+    Segments are located with one compiled regular expression per payload instead of
+    json.loads, and the segment times and run strings of the whole batch are parsed
+    together as byte buffers. Overlapping segments are accumulated.
+
+    Args:
+        payloads (pd.Series): Raw MeterReportPulseInfo JSON strings, one per device-day
+        return_last_minute (bool, optional): If True, also return the last minute of the day
+            each payload reports on, zero counts included. Defaults to False.
+
+    Returns:
+        np.ndarray: int16 array of shape (len(payloads), 1440) with pulses per minute, and
+            if return_last_minute is set, an int16 array with the last reported minute of
+            every payload (-1 if none)
+    """
+    payloads = payloads.fillna('').astype(str).tolist()
+    matrix = np.zeros((len(payloads), MINUTES_PER_DAY), dtype=np.int16)
+    last_minute = np.full(len(payloads), -1, dtype=np.int16)
+
+    # Payloads are emitted in compact form; drop whitespace from the odd pretty-printed one
+    per_row = [_SEGMENT_RE.findall(payload.replace(' ', '') if ' ' in payload else payload)
+               for payload in payloads]
+    counts = np.fromiter(map(len, per_row), dtype=np.int64, count=len(per_row))
+    if counts.sum() == 0:
+        return (matrix, last_minute) if return_last_minute else matrix
+
+    segments = list(chain.from_iterable(per_row))
+    rows = np.repeat(np.arange(len(per_row)), counts)
+
+    # Segment start times as fixed-width 'HH:MM' byte records
+    times = np.frombuffer(''.join(segment[_TIME_SLICE] for segment in segments).encode('ascii'),
+                          dtype=np.uint8).reshape(-1, 5).astype(np.int64) - ord('0')
+    starts = (times[:, 0] * 10 + times[:, 1]) * MINUTES_PER_HOUR + times[:, 3] * 10 + times[:, 4]
+
+    # Tokenise every run in one pass: '|' separates minutes, ';' terminates a segment
+    runs = ';'.join(segment[_RUNS_SLICE] for segment in segments) + ';'
+    chars = np.frombuffer(runs.encode('ascii', errors='replace'), dtype=np.uint8)
+    is_segment_end = chars == ord(';')
+    separators = np.flatnonzero(is_segment_end | (chars == ord('|')))
+    token_starts = np.concatenate(([0], separators[:-1] + 1))
+    token_lengths = separators - token_starts
+
+    # Segment and minute offset of every token
+    ends = is_segment_end[separators]
+    segment_of_token = np.concatenate(([0], np.cumsum(ends)[:-1]))
+    first_token = np.concatenate(([0], np.flatnonzero(ends)[:-1] + 1))
+    offsets = np.arange(len(separators)) - first_token[segment_of_token]
+
+    # Parse tokens digit by digit; counts rarely have more than two digits
+    values = np.zeros(len(separators), dtype=np.int64)
+    malformed = np.zeros(len(separators), dtype=bool)
+    for position in range(int(token_lengths.max())):
+        tokens = np.flatnonzero(token_lengths > position)
+        digits = chars[token_starts[tokens] + position].astype(np.int64) - ord('0')
+        malformed[tokens] |= (digits < 0) | (digits > 9)
+        values[tokens] = values[tokens] * 10 + digits
+
+    # Drop the empty token after a trailing '|', malformed tokens and minutes past midnight
+    minutes_of_day = starts[segment_of_token] + offsets
+    valid = (token_lengths > 0) & ~malformed & (minutes_of_day < MINUTES_PER_DAY)
+    np.add.at(matrix,
+              (rows[segment_of_token[valid]], minutes_of_day[valid]),
+              values[valid].astype(np.int16))
+
+    if return_last_minute:
+        np.maximum.at(last_minute, rows[segment_of_token[valid]], minutes_of_day[valid].astype(np.int16))
+        return matrix, last_minute
+    return matrix
+
+def decode_pulse_data(df: pd.DataFrame) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Decode extracted pulse records into a pulse matrix and its row index.
+
+    Args:
+        df (pd.DataFrame): Records with 'device_id_encoded' and 'data' columns, as written
+            to pulse_data_for_evaluation.csv. The 'date' column is used if present,
+            otherwise the pulseDate is read from the payload.
+
+    Returns:
+        Tuple[np.ndarray, pd.DataFrame]: (n, 1440) int16 pulse matrix and a DataFrame with
+            'device_id_encoded' and 'date' (pulseDate, yymmdd) aligned to the matrix rows
+    """
+    matrix = decode_pulse_matrix(df['data'])
+
+    if 'date' in df.columns:
+        dates = df['date'].astype(str).str.zfill(6)
+    else:
+        dates = extract_pulse_dates(df['data'])
+
+    index = pd.DataFrame({
+        'device_id_encoded': df['device_id_encoded'].astype(str).to_numpy(),
+        'date': dates.to_numpy()
+    })
+
+    return matrix, index
+
+def calculate_pulse_hourly(matrix: np.ndarray) -> np.ndarray:
+    """Aggregate a device-day x minute pulse matrix into hourly pulse counts.
+
+    Args:
+        matrix (np.ndarray): Pulse matrix of shape (n, 1440)
+
+    Returns:
+        np.ndarray: int16 array of shape (n, 24)
+    """
+    return matrix.reshape(-1, HOURS_PER_DAY, MINUTES_PER_HOUR).sum(axis=2, dtype=np.int16)
+
+def load_pulse_matrix(pulse_file: str) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Load a pulse matrix from a .npz file or decode it from an extracted pulse CSV.
+
+    Args:
+        pulse_file (str): Path to pulse_matrix.npz or pulse_data_for_evaluation.csv
+
+    Returns:
+        Tuple[np.ndarray, pd.DataFrame]: Pulse matrix and its row index
+    """
+    if Path(pulse_file).suffix == '.npz':
+        with np.load(pulse_file) as archive:
+            index = pd.DataFrame({
+                'device_id_encoded': archive['device_id_encoded'],
+                'date': archive['date']
+            })
+            return archive['pulses'], index
+
+    df = pd.read_csv(pulse_file, dtype={'device_id_encoded': str, 'date': str, 'data': str})
+    return decode_pulse_data(df)
+
+def save_pulse_matrix(matrix: np.ndarray, index: pd.DataFrame, output_file: str):
+    """Save a pulse matrix and its row index to a .npz file.
+
+    Args:
+        matrix (np.ndarray): Pulse matrix of shape (n, 1440)
+        index (pd.DataFrame): Row index with 'device_id_encoded' and 'date'
+        output_file (str): Path to output .npz file
+    """
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(output_file,
+             pulses=matrix,
+             device_id_encoded=index['device_id_encoded'].to_numpy(dtype=str),
+             date=index['date'].to_numpy(dtype=str))
+
+if __name__ == "__main__":
+    # Define file paths
+    data_dir = Path("data")
+    input_file = data_dir / "processed" / "pulse_data_for_evaluation.csv"
+    output_file = data_dir / "interim" / "pulse_matrix.npz"
+
+    # Decode pulse payloads
+    matrix, index = load_pulse_matrix(str(input_file))
+    save_pulse_matrix(matrix, index, str(output_file))
+
+    print(f"Decoded device-days: {len(index)}")
+    print(f"Unique devices: {index['device_id_encoded'].nunique()}")
+    print(f"Total pulses: {int(matrix.sum(dtype=np.int64))}")
+    print(f"\nPulse matrix saved to {output_file}")
@@ -1,11 +1,28 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
 import json
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from utils import map_label, EncodingDictManager
 
+# Community name and the number before each component marker, as searched by encode_address.
+# RE2 syntax for pyarrow.compute, where \p{Nd} matches the same digits as Python's \d
+COMMUNITY_PATTERN = r'^(?P<community_name>[^\p{Nd}]+)'
+COMPONENT_PATTERN = r'(?P<number>\p{{Nd}}+){marker}'
+
+# Prefixes used by encode_to_string, in output order
+ADDRESS_PREFIXES = {
+    'community_name': 'COM',
+    'phase': 'PH',
+    'building': 'BLD',
+    'unit': 'UN',
+    'floor': 'FL',
+    'room': 'RM'
+}
+
 class DataEncoder:
     def __init__(self):
         self.encoding_manager = EncodingDictManager()
@@ -21,20 +38,7 @@ class DataEncoder:
         
     def _get_or_create_encoding(self, category: str, value: str) -> str:
         """Get existing encoding or create new one for a value."""
-        if pd.isna(value) or value == '':
-            return 'MISSING'
-            
-        if value not in self.encoding_manager.get_encoding_dict(category):
-            existing_codes = set(self.encoding_manager.get_encoding_dict(category).values())
-            new_code = f"{category[0].upper()}{len(self.encoding_manager.get_encoding_dict(category)) + 1:03d}"
-            
-            while new_code in existing_codes:
-                new_code = f"{category[0].upper()}{int(new_code[1:]) + 1:03d}"
-                
-            self.encoding_manager.get_encoding_dict(category)[value] = new_code
-            self.encoding_manager.save_dicts()
-            
-        return self.encoding_manager.get_encoding_dict(category)[value]
+        return self.encoding_manager.get_or_create_encoding(category, value)
 
     def encode_address(self, address: str) -> Dict[str, str]:
         """Encode a Chinese address into structured components."""
@@ -105,6 +109,62 @@ class DataEncoder:
             print(f"Error details: {str(e)}")
             return 'INVALID_ADDRESS'
 
+    def _address_columns(self, addresses: pd.Series) -> Dict[str, pa.Array]:
+        """Address components of a column as arrow arrays, null where a component is missing.
+        
+        Every marker is searched over the whole column by pyarrow's regex kernel, and each
+        distinct community name is stripped and encoded once.
+        """
+        values = pa.array(addresses.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+        numbers = {marker: pc.struct_field(pc.extract_regex(values, COMPONENT_PATTERN.format(marker=marker)), [0])
+                   for marker in self.building_types}
+        
+        names = pc.struct_field(pc.extract_regex(values, COMMUNITY_PATTERN), [0])
+        distinct = pc.unique(names)
+        codes = self.encoding_manager.encode_series(
+            'community', pd.Series([name.strip() if name is not None else None for name in distinct.to_pylist()],
+                                   dtype=object))
+        codes = pa.array(codes.to_numpy(dtype=object), type=pa.string())
+        codes = pc.if_else(pc.equal(codes, 'MISSING'), pa.scalar(None, pa.string()), codes)
+        
+        return {
+            'community_name': pc.take(codes, pc.index_in(names, distinct)),
+            'phase': numbers['期'],
+            # Later markers win, as in encode_address: 号楼 over 楼 over 栋
+            'building': pc.coalesce(numbers['号楼'], numbers['楼'], numbers['栋']),
+            'unit': numbers['单元'],
+            'floor': numbers['层'],
+            'room': numbers['室']
+        }
+
+    def encode_address_components(self, addresses: pd.Series) -> pd.DataFrame:
+        """Encode a column of Chinese addresses into structured components in one pass.
+        
+        Vectorized equivalent of calling encode_address on every row.
+        """
+        columns = self._address_columns(addresses)
+        result = pd.DataFrame({
+            column: pc.fill_null(values, 'MISSING').to_numpy(zero_copy_only=False)
+            for column, values in columns.items()
+        }, index=addresses.index).astype(object)
+        result['original'] = addresses.fillna('')
+        return result
+
+    def encode_addresses(self, addresses: pd.Series) -> pd.Series:
+        """Convert a column of addresses to standardized strings in one pass.
+        
+        Vectorized equivalent of calling encode_to_string on every row.
+        """
+        columns = self._address_columns(addresses)
+        
+        # Join present components with '_', skipping missing ones: every present component
+        # becomes '_<prefix>_<value>', and the leading '_' is dropped
+        parts = [pc.fill_null(pc.binary_join_element_wise('', prefix, columns[column], '_'), '')
+                 for column, prefix in ADDRESS_PREFIXES.items()]
+        encoded = pc.utf8_slice_codeunits(pc.binary_join_element_wise(*parts, ''), start=1)
+        encoded = pc.if_else(pc.equal(encoded, ''), 'INVALID_ADDRESS', encoded)
+        return pd.Series(encoded.to_numpy(zero_copy_only=False), index=addresses.index, dtype=object)
+
     def encode_metadata(self, row: pd.Series) -> Dict[str, str]:
         """Encode device_id, usage, type, and annotation fields."""
         try:
@@ -157,17 +217,21 @@ def process_csv(input_path: str, output_path: str):
         # Initialize encoder
         encoder = DataEncoder()
         
-        # Add encoded fields
-        df['address_encoded'] = df['address'].apply(encoder.encode_to_string)
-        encoded_metadata = df.apply(encoder.encode_metadata, axis=1)
+        # Add encoded fields, saving the dictionaries once at the end
+        with encoder.encoding_manager.batch():
+            df['address_encoded'] = encoder.encode_addresses(df['address'])
+            encoded_metadata = {
+                col: encoder.encoding_manager.encode_series(col, df[col])
+                for col in ['device_id', 'usage', 'type', 'annotation']
+            }
         
         # Create output DataFrame with selected columns
         output_df = pd.DataFrame({
-            'device_id_encoded': encoded_metadata.apply(lambda x: x['device_id_encoded']),
+            'device_id_encoded': encoded_metadata['device_id'],
             'address_encoded': df['address_encoded'],
-            'usage_encoded': encoded_metadata.apply(lambda x: x['usage_encoded']),
-            'type_encoded': encoded_metadata.apply(lambda x: x['type_encoded']),
-            'annotation_encoded': encoded_metadata.apply(lambda x: x['annotation_encoded']),
+            'usage_encoded': encoded_metadata['usage'],
+            'type_encoded': encoded_metadata['type'],
+            'annotation_encoded': encoded_metadata['annotation'],
             'date_report': df['date_report'].dt.strftime('%Y/%m/%d'),
             'date_inspect': df['date_inspect'].dt.strftime('%Y/%m/%d'),
             'label': df['label']
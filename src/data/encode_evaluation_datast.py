@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List
 from pathlib import Path
-from utils import map_label, EncodingDictManager
+from utils import map_label, write_csv_if_changed, EncodingDictManager
 
 def load_tp_data(file_path: str) -> pd.DataFrame:
     """Load true positive (TP) report data."""
@@ -29,8 +29,12 @@ def load_fp_data(file_path: str) -> pd.DataFrame:
     
     return df_fp
 
-def process_reports(tp_path: str, fp_path: str, output_path: str):
-    """Process and merge TP and FP reports."""
+def process_reports(tp_path: str, fp_path: str, output_path: str, device_dates_path: str | None = None):
+    """Process and merge TP and FP reports.
+    
+    If device_dates_path is given, the reported (device, date) pairs are also written there,
+    but only when they changed, so that label corrections do not trigger a new pulse extraction.
+    """
     try:
         # Load data
         df_tp = load_tp_data(tp_path)
@@ -42,9 +46,10 @@ def process_reports(tp_path: str, fp_path: str, output_path: str):
         # Initialize encoding manager
         encoder = EncodingDictManager()
         
-        # Encode columns
-        for col in ['device_id', 'usage', 'type', 'annotation']:
-            df[f'{col}_encoded'] = df[col].apply(lambda x: encoder.get_or_create_encoding(col, x))
+        # Encode columns, saving the dictionaries once at the end
+        with encoder.batch():
+            for col in ['device_id', 'usage', 'type', 'annotation']:
+                df[f'{col}_encoded'] = encoder.encode_series(col, df[col])
         
         # Convert dates to standard format
         df['date_report'] = pd.to_datetime(df['date_report']).dt.strftime('%Y/%m/%d')
@@ -69,6 +74,9 @@ def process_reports(tp_path: str, fp_path: str, output_path: str):
         
         # Save processed data
         output_df.to_csv(output_path, index=False)
+        if device_dates_path is not None:
+            device_dates = output_df[['device_id_encoded', 'date_report']].drop_duplicates()
+            write_csv_if_changed(device_dates.sort_values(['device_id_encoded', 'date_report']), device_dates_path)
         
         # Print statistics
         print("\nProcessing Statistics:")
@@ -97,8 +105,9 @@ if __name__ == "__main__":
     tp_file = data_dir / "raw" / "report_202401-202404_TP.csv"
     fp_file = data_dir / "raw" / "report_202401-202404_FP.csv"
     output_file = data_dir / "processed" / "evaluation_dataset.csv"
+    device_dates_file = data_dir / "interim" / "evaluation_device_dates.csv"
     
     # Process reports
-    process_reports(str(tp_file), str(fp_file), str(output_file))
+    process_reports(str(tp_file), str(fp_file), str(output_file), str(device_dates_file))
     print(f"\nProcessed data saved to {output_file}") 
     
\ No newline at end of file
@@ -1,9 +1,14 @@
 import pandas as pd
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from utils import EncodingDictManager
+from decode_pulse_data import extract_pulse_dates
+from ingest_raw_data import read_pulse_store
+from index_raw_data import lookup_raw_records
 
 def load_device_dates(eval_file: str) -> Dict[str, List[str]]:
     """Load device IDs and their corresponding report dates from evaluation dataset.
@@ -16,13 +21,11 @@ def load_device_dates(eval_file: str) -> Dict[str, List[str]]:
     """
     df = pd.read_csv(eval_file)
     
-    # Load encoding dictionary
-    encoding_file = Path('data/interim/encoding_dicts.json')
-    with open(encoding_file, 'r', encoding='utf-8') as f:
-        encoding_dict = json.load(f)
+    # Load encoding dictionary, including codes still in its journal
+    encoding_dict = EncodingDictManager().get_encoding_dict('device_id')
     
     # Create reverse mapping (encoded -> original device_id)
-    device_mapping = {v: k for k, v in encoding_dict['device_id'].items()}
+    device_mapping = {v: k for k, v in encoding_dict.items()}
     
     # Group dates by device ID
     device_dates = {}
@@ -38,20 +41,94 @@ def load_device_dates(eval_file: str) -> Dict[str, List[str]]:
     
     return device_dates
 
-def extract_pulse_data(raw_file: str, device_dates: Dict[str, List[str]], output_file: str, test: bool = False):
+def build_device_date_pairs(device_dates: Dict[str, List[str]]) -> pd.DataFrame:
+    """Flatten the device dates mapping into a table of (device_id, date) pairs.
+    
+    Args:
+        device_dates (Dict[str, List[str]]): Dictionary of device IDs and their dates
+        
+    Returns:
+        pd.DataFrame: Unique pairs with 'device_id' and 'date' columns
+    """
+    pairs = pd.DataFrame(
+        [(device_id, date) for device_id, dates in device_dates.items() for date in dates],
+        columns=['device_id', 'date'],
+        dtype=str
+    )
+    return pairs.drop_duplicates(ignore_index=True)
+
+def filter_pulse_records(chunk: pd.DataFrame, device_pairs: pd.DataFrame, test: bool = False) -> pd.DataFrame:
+    """Keep only the raw records whose (device_id, pulseDate) pair is requested.
+    
+    The pulseDate is pulled out of the raw JSON with a vectorized string extraction, and
+    only the rows that survive the join against the requested pairs are parsed as JSON.
+    
+    Args:
+        chunk (pd.DataFrame): Raw records with 'device_id' and 'data' columns
+        device_pairs (pd.DataFrame): Requested pairs from build_device_date_pairs
+        test (bool, optional): If True, print debug information. Defaults to False.
+        
+    Returns:
+        pd.DataFrame: Matching records with 'device_id', 'date' and 'data' columns
+    """
+    # Filter devices
+    chunk = chunk[chunk['device_id'].isin(device_pairs['device_id'])]
+
+    # Add debug print
+    if test:    
+        print(f"Matching devices in chunk: {len(chunk)}")
+    
+    # Convert NaN to empty JSON string and pull out the pulse date without parsing
+    chunk = chunk.assign(data=chunk['data'].fillna('{}'))
+    chunk = chunk.assign(date=extract_pulse_dates(chunk['data']))
+
+    # Check which dates are needed for each device
+    chunk = chunk.merge(device_pairs, on=['device_id', 'date'], how='inner')
+
+    if test:    
+        # Add debug print
+        print(f"Matching device dates in chunk: {len(chunk)}")
+    
+    # Fully parse only the surviving rows to drop malformed payloads
+    valid = []
+    for device_id, data_str in zip(chunk['device_id'], chunk['data']):
+        try:
+            json.loads(data_str)
+            valid.append(True)
+        except (json.JSONDecodeError, TypeError) as e:
+            print(f"Error parsing JSON for device {device_id}: {e}")
+            valid.append(False)
+    
+    return chunk.loc[valid, ['device_id', 'date', 'data']]
+
+def extract_pulse_data(raw_file: str, device_dates: Dict[str, List[str]], output_file: str, test: bool = False,
+                       use_index: bool = False):
     """Extract pulse data for specified devices and dates.
     
     Args:
         raw_file (str): Path to raw data CSV file
         device_dates (Dict[str, List[str]]): Dictionary of device IDs and their dates
         output_file (str): Path to output file
+        use_index (bool, optional): If True, seek straight to the requested records using the
+            byte-offset index of the raw file (see index_raw_data.py) instead of scanning it.
+            The index is built first if missing or stale. Defaults to False.
     """
+    if use_index:
+        device_pairs = build_device_date_pairs(device_dates)
+        records = lookup_raw_records(raw_file, device_pairs)
+        if test:
+            # Add debug print
+            print(f"Indexed records found: {len(records)}")
+        save_pulse_records(filter_pulse_records(records, device_pairs, test), device_dates, output_file)
+        return
+    
     # Read raw data file in chunks
     chunk_size = 10000
     column_map = {'表号': 'device_id', '数据': 'data'}
     dtype_map = {'表号': str, '数据': str}  # Force 'data' column to be read as string
     chunks = pd.read_csv(raw_file, chunksize=chunk_size, usecols=list(column_map.keys()), 
                         dtype=dtype_map, encoding='gbk')
+    device_pairs = build_device_date_pairs(device_dates)
     extracted_records = []
     
     for chunk in chunks:
@@ -63,55 +140,45 @@ def extract_pulse_data(raw_file: str, device_dates: Dict[str, List[str]], output
             print(f"Chunk columns: {chunk.columns}")
             print(f"First few rows of chunk:\n{chunk.head()}")
         
-        # Filter devices
-        chunk = chunk[chunk['device_id'].isin(device_dates.keys())]
+        extracted_records.append(filter_pulse_records(chunk, device_pairs, test))
+    
+    # Save extracted records
+    output_df = pd.concat(extracted_records, ignore_index=True) if extracted_records else pd.DataFrame()
+    save_pulse_records(output_df, device_dates, output_file)
 
-        # Add debug print
-        if test:    
-            print(f"Matching devices in chunk: {len(chunk)}")
-        
-        for _, row in chunk.iterrows():
-            device_id = row['device_id']
-            try:
-                # Convert NaN or float to empty JSON string if necessary
-                data_str = row['data']
-                if pd.isna(data_str):
-                    data_str = '{}'
-                
-                data = json.loads(str(data_str))
-                pulse_date = data.get('pulseDate')
-
-                if test:    
-                    # Add debug print
-                    print(f"Device ID: {device_id}")
-                    print(f"Pulse date: {pulse_date}")
-                
-                # Check if this date is needed for this device
-                if pulse_date and pulse_date in device_dates[device_id]:
-                    extracted_records.append({
-                        'device_id': device_id,
-                        'date': pulse_date,
-                        'data': data_str
-                    })
-            except (json.JSONDecodeError, TypeError) as e:
-                print(f"Error parsing JSON for device {device_id}: {e}")
-                continue
+def extract_pulse_data_from_store(store_dir: str, device_dates: Dict[str, List[str]], output_file: str):
+    """Extract pulse data for specified devices and dates from the Parquet pulse store.
+    
+    Only the store partitions and columns holding the requested device-days are read,
+    instead of rescanning the raw GBK files (see ingest_raw_data.py).
     
+    Args:
+        store_dir (str): Root directory of the Parquet store
+        device_dates (Dict[str, List[str]]): Dictionary of device IDs and their dates
+        output_file (str): Path to output file
+    """
+    device_pairs = build_device_date_pairs(device_dates)
+    records = filter_pulse_records(read_pulse_store(store_dir, device_pairs), device_pairs)
+    save_pulse_records(records, device_dates, output_file)
+
+def save_pulse_records(output_df: pd.DataFrame, device_dates: Dict[str, List[str]], output_file: str):
+    """Encode device IDs of extracted records and save them.
+    
+    Args:
+        output_df (pd.DataFrame): Extracted records with 'device_id', 'date' and 'data' columns
+        device_dates (Dict[str, List[str]]): Dictionary of device IDs and their dates
+        output_file (str): Path to output file
+    """
     # Initialize encoding manager
     encoding_manager = EncodingDictManager()
     
-    # Save extracted records
-    output_df = pd.DataFrame(extracted_records)
-    
     # Add safety check for empty DataFrame
     if len(output_df) == 0:
         print("\nWarning: No records were extracted!")
         return
     
     # Encode device IDs before saving
-    output_df['device_id_encoded'] = output_df['device_id'].apply(
-        lambda x: encoding_manager.get_or_create_encoding('device_id', x)
-    )
+    output_df['device_id_encoded'] = encoding_manager.encode_series('device_id', output_df['device_id'])
     # Drop the original device_id column
     output_df = output_df.drop(columns=['device_id'])
 
@@ -127,20 +194,51 @@ def extract_pulse_data(raw_file: str, device_dates: Dict[str, List[str]], output
     print(f"Unique devices found: {output_df['device_id_encoded'].nunique()}")
     print(f"Unique dates found: {output_df['date'].nunique()}")
 
-def main(test: bool = False):
+def process_raw_file(raw_file: str, device_dates: Dict[str, List[str]], output_file: str, 
+                     test: bool = False, use_index: bool = False) -> Tuple[str, bool, str]:
+    """Extract pulse data from a single raw file, capturing any error.
+    
+    Args:
+        raw_file (str): Path to raw data CSV file
+        device_dates (Dict[str, List[str]]): Dictionary of device IDs and their dates
+        output_file (str): Path to output file
+        test (bool, optional): If True, print debug information. Defaults to False.
+        use_index (bool, optional): If True, use the byte-offset index. Defaults to False.
+        
+    Returns:
+        Tuple[str, bool, str]: Raw file path, success flag and error message
+    """
+    try:
+        extract_pulse_data(raw_file, device_dates, output_file, test, use_index)
+        return raw_file, True, ''
+    except Exception as e:
+        return raw_file, False, str(e)
+
+def main(test: bool = False, workers: int = 1, store_dir: Optional[str] = None, use_index: bool = False):
     """Process pulse data from raw CSV files.
     
     Args:
         test (bool, optional): If True, only process a single test file. Defaults to False.
+        workers (int, optional): Number of worker processes. Files are processed one at a 
+            time in this process when set to 1. Defaults to 1.
+        store_dir (Optional[str], optional): Parquet pulse store built by ingest_raw_data.py.
+            If given, records are read from the store instead of the raw files. Defaults to None.
+        use_index (bool, optional): If True, seek to records through the byte-offset index of
+            each raw file instead of scanning it. Defaults to False.
     """
     # Define file paths using pathlib
     data_dir = Path("data")
     eval_file = data_dir / "processed" / "evaluation_dataset.csv"
+    # Only the reported (device, date) pairs are needed; prefer the file that is left
+    # untouched when just the labels change
+    device_dates_file = data_dir / "interim" / "evaluation_device_dates.csv"
+    if device_dates_file.exists():
+        eval_file = device_dates_file
     raw_dir = data_dir / "raw"
     interim_dir = data_dir / "interim"
     
     # Validate directory structure
-    if not raw_dir.exists():
+    if store_dir is None and not raw_dir.exists():
         raise FileNotFoundError(f"Raw data directory not found: {raw_dir}")
     if not eval_file.exists():
         raise FileNotFoundError(f"Evaluation dataset not found: {eval_file}")
@@ -156,6 +254,13 @@ def main(test: bool = False):
         print(f"Error loading device dates: {str(e)}")
         return
     
+    # Read only the needed partitions from the pulse store if one is given
+    if store_dir is not None:
+        combined_file = data_dir / "processed" / "pulse_data_for_evaluation.csv"
+        print(f"\nExtracting from pulse store {store_dir}...")
+        extract_pulse_data_from_store(store_dir, device_dates, str(combined_file))
+        return
+    
     # Get list of raw files to process
     if test:
         test_file = raw_dir / "202401_01-09.csv"
@@ -177,19 +282,34 @@ def main(test: bool = False):
     # Process each file
     successful = 0
     failed = 0
+    output_files = {raw_file: interim_dir / f"pulse_data_{raw_file.stem}.csv" for raw_file in raw_files}
     
-    for raw_file in raw_files:
-        print(f"\nProcessing {raw_file.name}...")
-        output_file = interim_dir / f"pulse_data_{raw_file.stem}.csv"
-        
-        try:
-            extract_pulse_data(str(raw_file), device_dates, str(output_file), test)
+    def report(raw_file: Path, success: bool, error: str):
+        nonlocal successful, failed
+        if success:
             print(f"✓ Successfully processed {raw_file.name}")
             successful += 1
-        except Exception as e:
-            print(f"✗ Error processing {raw_file.name}: {str(e)}")
+        else:
+            print(f"✗ Error processing {raw_file.name}: {error}")
             failed += 1
-            continue
+    
+    if workers > 1:
+        print(f"\nProcessing with {workers} worker processes...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_raw_file, str(raw_file), device_dates, 
+                                str(output_files[raw_file]), test, use_index): raw_file
+                for raw_file in raw_files
+            }
+            for future in as_completed(futures):
+                _, success, error = future.result()
+                report(futures[future], success, error)
+    else:
+        for raw_file in raw_files:
+            print(f"\nProcessing {raw_file.name}...")
+            _, success, error = process_raw_file(str(raw_file), device_dates, 
+                                                 str(output_files[raw_file]), test, use_index)
+            report(raw_file, success, error)
     
     # Print summary
     print("\nProcessing Summary:")
@@ -197,8 +317,11 @@ def main(test: bool = False):
     print(f"Successful: {successful}")
     print(f"Failed: {failed}")
 
-    # Combine all processed files
-    processed_files = list(interim_dir.glob('pulse_data_*.csv'))
+    # Combine processed files in raw file order so the merged output is deterministic
+    processed_files = [output_files[raw_file] for raw_file in raw_files if output_files[raw_file].exists()]
+    if not processed_files:
+        print("No processed files to combine")
+        return
     dfs = []
     for file in processed_files:
         df = pd.read_csv(file)
@@ -214,4 +337,11 @@ def main(test: bool = False):
 
 
 if __name__ == "__main__":
-    main(test=False) 
+    parser = argparse.ArgumentParser(description="Extract pulse data for the evaluation dataset from raw files.")
+    parser.add_argument('--test', action='store_true', help="Only process the single test file")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument('--store', default=None, help="Read from a Parquet pulse store built by ingest_raw_data.py")
+    parser.add_argument('--use-index', action='store_true', help="Seek to records using byte-offset indexes of the raw files")
+    args = parser.parse_args()
+    
+    main(test=args.test, workers=args.workers, store_dir=args.store, use_index=args.use_index)
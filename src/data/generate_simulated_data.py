@@ -1,43 +1,98 @@
-from typing import Tuple
+import argparse
+from typing import Iterable, Iterator, Tuple
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from scipy.ndimage import gaussian_filter1d
 
-def add_perturbation(flow_rate: np.ndarray | float, time: np.ndarray) -> np.ndarray:
+# Columns of the compact storage format. Per-minute values are stored once per minute instead of
+# being repeated for every second, and counts and rates use narrow dtypes.
+SECONDS_COLUMNS = {
+    'time_seconds': np.int32,
+    'actual_flow_rate': np.float32,
+    'pulse_counts': np.int8,
+    'event1_rate': np.float32,
+    'event2_rate': np.float32,
+    'event3_rate': np.float32
+}
+MINUTES_COLUMNS = {
+    'time_minutes': np.int32,
+    'pulse_counts_per_minute': np.int16,
+    'observed_flow_rate': np.float32,
+    'smoothed_flow_rate': np.float32
+}
+
+def add_perturbation(flow_rate: np.ndarray | float, time: np.ndarray,
+                     long_amplitude: np.ndarray | float = 0.03,
+                     short_amplitude: np.ndarray | float = 0.002) -> np.ndarray:
     """
     Add random perturbation to the flow rate with two characteristic frequencies.
     :param flow_rate: Base flow rate (float or numpy array).
     :param time: Array of time values.
+    :param long_amplitude: Relative amplitude of the 1-hour component (float or array broadcasting against flow_rate).
+    :param short_amplitude: Relative amplitude of the 1-minute component (float or array broadcasting against flow_rate).
     :return: Flow rate array with perturbations.
     """
-    long_periodic = 0.03 * flow_rate * np.sin(np.pi * time / 1800)
-    short_periodic = 0.002 * flow_rate * np.cos(np.pi * time / 30)
+    long_periodic = long_amplitude * flow_rate * np.sin(np.pi * time / 1800)
+    short_periodic = short_amplitude * flow_rate * np.cos(np.pi * time / 30)
     return flow_rate + long_periodic + short_periodic
 
 def calculate_pulse_counts(flow_rates: np.ndarray, chamber_volume: float, time_interval: int = 1) -> np.ndarray:
     """
-    Calculate the pulse counts per minute.
+    Calculate the pulse counts per time step.
+    A pulse fires each time the cumulative volume passes another multiple of the chamber volume.
+    Accepts a single series or a batch of shape (households, time steps); the last axis is time.
+    :param flow_rates: Flow rates per time step (m³/s).
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :param time_interval: Length of a time step (s).
+    :return: Pulse counts per time step, same shape and dtype as flow_rates.
+    """
+    flow_rates = np.asarray(flow_rates)
+    cumulative_volume = np.cumsum(flow_rates, axis=-1) * time_interval
+    pulses_so_far, _ = _count_thresholds_passed(cumulative_volume, chamber_volume)
+    pulse_counts = np.diff(pulses_so_far, axis=-1, prepend=0)
+
+    return pulse_counts.astype(flow_rates.dtype)
+
+def _count_thresholds_passed(cumulative_volume: np.ndarray, chamber_volume: float,
+                             last_threshold: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count the volume thresholds above last_threshold passed so far at every time step.
+    Thresholds are accumulated by repeated addition, like a running threshold, so the result
+    is bit-identical to stepping through the series one pulse at a time.
+    :param cumulative_volume: Cumulative volume; the last axis is time.
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :param last_threshold: Last threshold already passed (0 at the start of a series).
+    :return: Running count of thresholds passed, and the thresholds themselves.
     """
-    cumulative_volume = np.cumsum(flow_rates) * time_interval
-    pulse_counts = np.zeros_like(flow_rates)
+    max_volume = np.max(cumulative_volume, initial=last_threshold)
+    n_thresholds = int((max_volume - last_threshold) // chamber_volume) + 2
+    thresholds = np.cumsum(np.concatenate(([last_threshold], np.full(n_thresholds, chamber_volume))))[1:]
 
-    volume_threshold_accumulated = chamber_volume
-    for i in range(len(pulse_counts)):
-        while cumulative_volume[i] >= volume_threshold_accumulated:
-            pulse_counts[i] += 1
-            volume_threshold_accumulated += chamber_volume
+    # A threshold once passed stays passed
+    passed = np.searchsorted(thresholds, cumulative_volume, side='right')
+    return np.maximum.accumulate(passed, axis=-1), thresholds
 
-    return pulse_counts
+def aggregate_per_minute(values: np.ndarray, steps_per_minute: int = 60) -> np.ndarray:
+    """
+    Sum per-step values into per-minute totals, dropping an incomplete last minute.
+    :param values: Array whose last axis is time.
+    :param steps_per_minute: Number of time steps per minute.
+    :return: Per-minute totals.
+    """
+    values = np.asarray(values)
+    n_minutes = values.shape[-1] // steps_per_minute
+    minutes = values[..., :n_minutes * steps_per_minute]
+    return minutes.reshape(*values.shape[:-1], n_minutes, steps_per_minute).sum(axis=-1)
 
 def calculate_observed_flow_rate(pulse_counts: np.ndarray, chamber_volume: float, time_interval: int = 1) -> np.ndarray:
     """
     Calculate the observed flow rate based on pulse counts.
     """
-    observed_flow_rates = np.zeros_like(pulse_counts, dtype=float)
-    for i in range(len(pulse_counts)):
-        if pulse_counts[i] > 0:
-            observed_flow_rates[i] = (chamber_volume * pulse_counts[i]) / time_interval
-    return observed_flow_rates
+    pulse_counts = np.asarray(pulse_counts)
+    observed_flow_rates = (chamber_volume * pulse_counts) / time_interval
+    return np.where(pulse_counts > 0, observed_flow_rates, 0.0).astype(float)
 
 def calculate_event_flow_rates(time: np.ndarray, duration: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
@@ -45,15 +100,17 @@ def calculate_event_flow_rates(time: np.ndarray, duration: int) -> Tuple[np.ndar
     """
     event1_flow_rate = np.full_like(time, 0.05 / 3600, dtype=np.double)
 
+    # Events are placed by time value rather than array position, so any window of the
+    # timeline can be computed on its own
     event2_flow_rate = np.zeros_like(time, dtype=np.double)
     event2_start, event2_end = int(3 * duration / 5), int(4 * duration / 5)
-    event2_flow_rate[event2_start:event2_end] = 0.2 / 3600
+    event2_flow_rate[(time >= event2_start) & (time < event2_end)] = 0.2 / 3600
 
     event3_flow_rate = np.zeros_like(time, dtype=np.double)
     period_length = duration // 6
     for start in range(duration // 2, duration, period_length):
         end = start + int(0.2 * period_length)
-        event3_flow_rate[start:end] = 1.2 / 3600
+        event3_flow_rate[(time >= start) & (time < end)] = 1.2 / 3600
 
     return event1_flow_rate, event2_flow_rate, event3_flow_rate
 
@@ -73,7 +130,7 @@ def generate_flow_data(duration: int = 3600, chamber_volume: float = 0.01, super
         flow_rates_with_perturbation = add_perturbation(combined_flow_rates, time_seconds)
 
     pulse_counts = calculate_pulse_counts(flow_rates_with_perturbation, chamber_volume, 1)
-    pulse_counts_per_minute = np.array([np.sum(pulse_counts[i * 60:(i + 1) * 60]) for i in time_minutes])
+    pulse_counts_per_minute = aggregate_per_minute(pulse_counts)
     observed_flow_rates = calculate_observed_flow_rate(pulse_counts_per_minute, chamber_volume, 1)
     smoothed_flow_rates = gaussian_filter1d(observed_flow_rates, sigma=2)
 
@@ -95,10 +152,196 @@ def generate_flow_data(duration: int = 3600, chamber_volume: float = 0.01, super
 
     return df
 
+def iter_flow_data(duration: int = 3600, chamber_volume: float = 0.01, superposition: bool = True,
+                   chunk_seconds: int = 3600) -> Iterator[pd.DataFrame]:
+    """
+    Generate flow data as a stream of fixed-size time chunks with constant memory.
+    Cumulative volume and pulse threshold state carry across chunk boundaries, and each
+    chunk is smoothed over a window extending past its edges by the Gaussian kernel radius,
+    so the concatenated chunks equal generate_flow_data with the same arguments.
+    :param duration: Simulated duration (s), a whole number of minutes.
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :param superposition: Whether to simulate the three events instead of a constant flow.
+    :param chunk_seconds: Length of each chunk (s), a whole number of minutes.
+    :return: Iterator over DataFrames with the columns of generate_flow_data.
+    """
+    if duration % 60 or chunk_seconds % 60 or chunk_seconds <= 0:
+        raise ValueError("duration and chunk_seconds must be positive whole numbers of minutes")
+
+    sigma = 2
+    radius = int(4.0 * sigma + 0.5)  # Kernel radius of gaussian_filter1d with default truncate
+
+    volume_carry = 0.0
+    last_threshold = 0.0
+    pending = []                     # Chunks waiting for enough minutes after them to smooth
+    observed_window = np.empty(0)    # Observed per-minute flow rates from window_start onwards
+    window_start = 0
+
+    for start in range(0, duration, chunk_seconds):
+        end = min(start + chunk_seconds, duration)
+        time_seconds = np.arange(start, end, 1)
+        time_minutes = np.arange(start // 60, end // 60)
+
+        if not superposition:
+            flow_rate_base = 1.3
+            flow_rates_with_perturbation = add_perturbation(flow_rate_base / 3600, time_seconds)
+        else:
+            event1_rate, event2_rate, event3_rate = calculate_event_flow_rates(time_seconds, duration)
+            combined_flow_rates = event1_rate + event2_rate + event3_rate
+            flow_rates_with_perturbation = add_perturbation(combined_flow_rates, time_seconds)
+
+        # Continue the cumulative sum and the threshold sequence from the previous chunk
+        cumulative_volume = np.cumsum(np.concatenate(([volume_carry], flow_rates_with_perturbation)))[1:]
+        volume_carry = cumulative_volume[-1]
+        pulses_so_far, thresholds = _count_thresholds_passed(cumulative_volume, chamber_volume, last_threshold)
+        if pulses_so_far[-1] > 0:
+            last_threshold = thresholds[pulses_so_far[-1] - 1]
+        pulse_counts = np.diff(pulses_so_far, prepend=0).astype(flow_rates_with_perturbation.dtype)
+
+        pulse_counts_per_minute = aggregate_per_minute(pulse_counts)
+        observed_flow_rates = calculate_observed_flow_rate(pulse_counts_per_minute, chamber_volume, 1)
+        observed_window = np.concatenate((observed_window, observed_flow_rates))
+
+        chunk = pd.DataFrame({
+            'time_seconds': time_seconds,
+            'time_minutes': np.repeat(time_minutes + 1, 60),
+            'actual_flow_rate': flow_rates_with_perturbation * 3600,  # Convert to m³/hour
+            'pulse_counts': pulse_counts,
+            'pulse_counts_per_minute': np.repeat(pulse_counts_per_minute, 60),
+            'observed_flow_rate': np.repeat(observed_flow_rates.astype(np.float64) * 60, 60),  # Convert to m³/hour
+            'smoothed_flow_rate': np.nan
+        }, index=pd.RangeIndex(start, end))
+
+        if superposition:
+            chunk['event1_rate'] = event1_rate * 3600
+            chunk['event2_rate'] = event2_rate * 3600
+            chunk['event3_rate'] = event3_rate * 3600
+
+        pending.append((chunk, start // 60, end // 60))
+
+        # Emit chunks once the window reaches radius minutes past them, or the series ends
+        while pending:
+            chunk, first_minute, end_minute = pending[0]
+            if end < duration and window_start + len(observed_window) < end_minute + radius:
+                break
+
+            smoothed_flow_rates = gaussian_filter1d(observed_window, sigma=sigma)
+            smoothed_flow_rates = smoothed_flow_rates[first_minute - window_start:end_minute - window_start]
+            chunk['smoothed_flow_rate'] = np.repeat(smoothed_flow_rates.astype(np.float64) * 60, 60)  # Convert to m³/hour
+            yield chunk
+            pending.pop(0)
+
+            # Keep radius minutes of context before the next chunk
+            keep_from = max(end_minute - radius, window_start)
+            observed_window = observed_window[keep_from - window_start:]
+            window_start = keep_from
+
+def save_flow_data_stream(output_file: str, duration: int = 3600, chamber_volume: float = 0.01,
+                          superposition: bool = True, chunk_seconds: int = 3600):
+    """
+    Generate flow data chunk by chunk and append it to a CSV file.
+    :param output_file: Path to output CSV file.
+    :param duration: Simulated duration (s).
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :param superposition: Whether to simulate the three events instead of a constant flow.
+    :param chunk_seconds: Length of each chunk (s).
+    """
+    for _ in append_flow_data_csv(iter_flow_data(duration, chamber_volume, superposition, chunk_seconds), output_file):
+        pass
+
+def append_flow_data_csv(chunks: Iterable[pd.DataFrame], output_file: str) -> Iterator[pd.DataFrame]:
+    """
+    Pass flow data chunks through while writing them to a CSV file.
+    :param chunks: Flow data chunks.
+    :param output_file: Path to output CSV file.
+    :return: Iterator over the same chunks.
+    """
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(output_file, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        yield chunk
+
+def _narrow_columns(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Cast the available columns to their storage dtypes, refusing to wrap integer counts.
+    :param df: DataFrame holding (a superset of) the columns.
+    :param dtypes: Storage dtype of every column.
+    :return: DataFrame with the narrowed columns.
+    """
+    narrowed = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        values = df[column].to_numpy()
+        if np.issubdtype(dtype, np.integer) and len(values) and values.max() > np.iinfo(dtype).max:
+            raise ValueError(f"{column} exceeds the range of {np.dtype(dtype).name}")
+        narrowed[column] = values.astype(dtype)
+    return pd.DataFrame(narrowed)
+
+def split_flow_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split flow data into a per-second and a per-minute table with narrow dtypes.
+    :param df: Flow data as returned by generate_flow_data, covering whole minutes.
+    :return: Per-second table and per-minute table.
+    """
+    per_second = _narrow_columns(df, SECONDS_COLUMNS)
+    per_minute = _narrow_columns(df.iloc[::60], MINUTES_COLUMNS)
+    return per_second, per_minute
+
+def save_flow_data_compact(flow_data: pd.DataFrame | Iterable[pd.DataFrame],
+                           output_prefix: str = 'data/processed/simulated_flow_data') -> Tuple[str, str]:
+    """
+    Save flow data as '<prefix>_seconds.parquet' and '<prefix>_minutes.parquet'.
+    Chunks from iter_flow_data are appended as they arrive, so long simulations never
+    have to be held in memory.
+    :param flow_data: Flow data, or an iterable of flow data chunks.
+    :param output_prefix: Path prefix of the two output files.
+    :return: Paths of the per-second and per-minute files.
+    """
+    if isinstance(flow_data, pd.DataFrame):
+        flow_data = [flow_data]
+
+    seconds_file, minutes_file = f"{output_prefix}_seconds.parquet", f"{output_prefix}_minutes.parquet"
+    seconds_writer = minutes_writer = None
+    try:
+        for chunk in flow_data:
+            per_second, per_minute = split_flow_data(chunk)
+            seconds_table = pa.Table.from_pandas(per_second, preserve_index=False)
+            minutes_table = pa.Table.from_pandas(per_minute, preserve_index=False)
+            if seconds_writer is None:
+                seconds_writer = pq.ParquetWriter(seconds_file, seconds_table.schema)
+                minutes_writer = pq.ParquetWriter(minutes_file, minutes_table.schema)
+            seconds_writer.write_table(seconds_table)
+            minutes_writer.write_table(minutes_table)
+    finally:
+        if seconds_writer is not None:
+            seconds_writer.close()
+            minutes_writer.close()
+
+    return seconds_file, minutes_file
+
+def load_flow_data_compact(output_prefix: str = 'data/processed/simulated_flow_data') -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load the per-second and per-minute tables written by save_flow_data_compact.
+    :param output_prefix: Path prefix of the two files.
+    :return: Per-second table and per-minute table.
+    """
+    per_second = pd.read_parquet(f"{output_prefix}_seconds.parquet", memory_map=True)
+    per_minute = pd.read_parquet(f"{output_prefix}_minutes.parquet", memory_map=True)
+    return per_second, per_minute
+
 if __name__ == "__main__":
-    # Generate data
-    df = generate_flow_data()
-    
-    # Save to CSV
-    df.to_csv('data/processed/simulated_flow_data.csv', index=False)
+    parser = argparse.ArgumentParser(description="Generate simulated gas flow data.")
+    parser.add_argument('--duration', type=int, default=3600, help="Simulated duration in seconds")
+    parser.add_argument('--chunk-seconds', type=int, default=3600, help="Seconds generated per chunk")
+    parser.add_argument('--no-csv', action='store_true', help="Only write the compact Parquet tables")
+    args = parser.parse_args()
+
+    output_prefix = 'data/processed/simulated_flow_data'
+    chunks = iter_flow_data(duration=args.duration, chunk_seconds=args.chunk_seconds)
+
+    if not args.no_csv:
+        chunks = append_flow_data_csv(chunks, f"{output_prefix}.csv")
+
+    # Save to compact tables, and to CSV unless disabled
+    save_flow_data_compact(chunks, output_prefix)
     print("Data generated and saved successfully!") 
\ No newline at end of file
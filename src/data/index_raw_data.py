@@ -0,0 +1,161 @@
+import re
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+RAW_ENCODING = 'gbk'
+DEVICE_COLUMN = '表号'
+DATA_COLUMN = '数据'
+INDEX_SUFFIX = '.idx.parquet'
+
+_PULSE_DATE_RE = re.compile(rb'""pulseDate""\s*:\s*""(\d{6})""|"pulseDate"\s*:\s*"(\d{6})"')
+
+def get_index_path(raw_file: str) -> Path:
+    """Get the sidecar index path for a raw file."""
+    raw_file = Path(raw_file)
+    return raw_file.with_name(raw_file.name + INDEX_SUFFIX)
+
+def _read_header(f) -> Tuple[List[str], int]:
+    """Read the CSV header of a raw file opened in binary mode.
+
+    Returns:
+        Tuple[List[str], int]: Column names and the byte offset of the first record
+    """
+    header = f.readline()
+    columns = next(csv.reader([header.decode(RAW_ENCODING).lstrip('﻿')]))
+    return columns, len(header)
+
+def _iter_records(f, offset: int):
+    """Yield (offset, raw bytes) of every CSV record, joining quoted fields that span lines."""
+    record = b''
+    start = offset
+    for line in f:
+        if not record:
+            start = offset
+        record += line
+        offset += len(line)
+        # A record is complete once its quotes are balanced
+        if record.count(b'"') % 2 == 0:
+            yield start, record
+            record = b''
+    if record:
+        yield start, record
+
+def _parse_record(record: bytes) -> List[str]:
+    """Parse one raw CSV record into its fields."""
+    return next(csv.reader([record.decode(RAW_ENCODING).rstrip('\r\n')]), [])
+
+def build_raw_index(raw_file: str, index_file: Optional[str] = None) -> pd.DataFrame:
+    """Build a sidecar index mapping (表号, pulseDate) to byte ranges in a raw file.
+
+    Args:
+        raw_file (str): Path to raw data CSV file
+        index_file (Optional[str]): Path to index file. Defaults to '<raw_file>.idx.parquet'.
+
+    Returns:
+        pd.DataFrame: Index with 'device_id', 'date', 'offset' and 'length' columns
+    """
+    index_file = Path(index_file) if index_file else get_index_path(raw_file)
+    device_ids, dates, offsets, lengths = [], [], [], []
+
+    with open(raw_file, 'rb') as f:
+        columns, offset = _read_header(f)
+        device_pos = columns.index(DEVICE_COLUMN)
+
+        for start, record in _iter_records(f, offset):
+            # The pulse date is ASCII, so it can be read without decoding the record
+            date_match = _PULSE_DATE_RE.search(record)
+            if not date_match:
+                continue
+            fields = _parse_record(record)
+            if len(fields) <= device_pos or not fields[device_pos]:
+                continue
+            device_ids.append(fields[device_pos])
+            dates.append((date_match.group(1) or date_match.group(2)).decode('ascii'))
+            offsets.append(start)
+            lengths.append(len(record))
+
+    index = pd.DataFrame({
+        'device_id': pd.Series(device_ids, dtype=str),
+        'date': pd.Series(dates, dtype=str),
+        'offset': np.array(offsets, dtype=np.int64),
+        'length': np.array(lengths, dtype=np.int32)
+    })
+    index = index.sort_values(['device_id', 'date'], kind='stable', ignore_index=True)
+    index.to_parquet(index_file, index=False)
+
+    return index
+
+def load_raw_index(raw_file: str, rebuild: bool = True) -> pd.DataFrame:
+    """Load the sidecar index of a raw file, building it if missing or stale.
+
+    Args:
+        raw_file (str): Path to raw data CSV file
+        rebuild (bool, optional): If True, build the index when it is missing or older than
+            the raw file. Otherwise raise FileNotFoundError. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Index with 'device_id', 'date', 'offset' and 'length' columns
+    """
+    index_file = get_index_path(raw_file)
+    if index_file.exists() and index_file.stat().st_mtime >= Path(raw_file).stat().st_mtime:
+        return pd.read_parquet(index_file)
+    if not rebuild:
+        raise FileNotFoundError(f"Index not found or out of date: {index_file}")
+    return build_raw_index(raw_file, str(index_file))
+
+def lookup_raw_records(raw_file: str, device_pairs: pd.DataFrame,
+                       index: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Read specific device-days from a raw file by seeking to their indexed byte ranges.
+
+    Args:
+        raw_file (str): Path to raw data CSV file
+        device_pairs (pd.DataFrame): Requested raw 'device_id' and pulse 'date' pairs
+        index (Optional[pd.DataFrame]): Preloaded index. Defaults to the sidecar index.
+
+    Returns:
+        pd.DataFrame: Matching records with 'device_id', 'date' and 'data' columns
+    """
+    if index is None:
+        index = load_raw_index(raw_file)
+
+    # Read matches in file order so the output follows the raw file
+    matches = index.merge(device_pairs[['device_id', 'date']].drop_duplicates(),
+                          on=['device_id', 'date'], how='inner')
+    matches = matches.sort_values('offset', ignore_index=True)
+
+    records = []
+    with open(raw_file, 'rb') as f:
+        columns, _ = _read_header(f)
+        device_pos = columns.index(DEVICE_COLUMN)
+        data_pos = columns.index(DATA_COLUMN)
+
+        for offset, length, date in zip(matches['offset'], matches['length'], matches['date']):
+            f.seek(offset)
+            fields = _parse_record(f.read(length))
+            records.append({
+                'device_id': fields[device_pos],
+                'date': date,
+                'data': fields[data_pos] if len(fields) > data_pos else None
+            })
+
+    return pd.DataFrame(records, columns=['device_id', 'date', 'data'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build byte-offset indexes for raw pulse exports.")
+    parser.add_argument('raw_files', nargs='*', help="Raw files to index (default: data/raw/2024*_*.csv)")
+    args = parser.parse_args()
+
+    raw_files = [Path(f) for f in args.raw_files] or sorted(Path('data/raw').glob('2024*_*.csv'))
+    if not raw_files:
+        print("No matching CSV files found to index")
+
+    for raw_file in raw_files:
+        try:
+            index = build_raw_index(str(raw_file))
+            print(f"✓ Indexed {raw_file.name}: {len(index)} records -> {get_index_path(str(raw_file)).name}")
+        except Exception as e:
+            print(f"✗ Error indexing {raw_file.name}: {str(e)}")
@@ -0,0 +1,195 @@
+import re
+import json
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+from decode_pulse_data import extract_pulse_dates
+
+DEFAULT_STORE_DIR = Path('data/interim/pulse_store')
+DEFAULT_N_BUCKETS = 16
+METADATA_FILE = '_store.json'
+PARTITIONING = ds.partitioning(pa.schema([('month', pa.string()), ('bucket', pa.int32())]), flavor='hive')
+# Schema of every written chunk, so that parts stay compatible even when a chunk's column is
+# all missing or pandas infers a different string type
+RECORD_SCHEMA = pa.schema([('device_id', pa.string()), ('date', pa.string()), ('data', pa.string()),
+                           ('month', pa.string()), ('bucket', pa.int32())])
+
+def device_buckets(device_ids: pd.Series, n_buckets: int) -> np.ndarray:
+    """Assign device IDs to hash buckets.
+
+    CRC32 is used instead of Python's hash() so that bucket assignment is stable across
+    processes and interpreter runs.
+
+    Args:
+        device_ids (pd.Series): Raw device IDs (表号)
+        n_buckets (int): Number of hash buckets
+
+    Returns:
+        np.ndarray: Bucket number for each device ID
+    """
+    return np.fromiter(
+        (zlib.crc32(str(device_id).encode('utf-8')) % n_buckets for device_id in device_ids),
+        dtype=np.int32,
+        count=len(device_ids)
+    )
+
+def pulse_date_months(dates: pd.Series) -> pd.Series:
+    """Convert pulseDate strings (yymmdd) into month partition values (yyyymm)."""
+    return ('20' + dates.str[:4]).fillna('unknown')
+
+def load_store_metadata(store_dir: str) -> Dict[str, int]:
+    """Load the store metadata, or an empty dict if the store does not exist yet."""
+    metadata_file = Path(store_dir) / METADATA_FILE
+    if metadata_file.exists():
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def ingest_raw_file(raw_file: str, store_dir: str, n_buckets: int = DEFAULT_N_BUCKETS,
+                    chunk_size: int = 100000) -> int:
+    """Convert a GBK-encoded raw monthly file into the partitioned Parquet store.
+
+    Records are written with 'device_id', 'date' (pulseDate) and 'data' columns, partitioned
+    by pulse month and device ID hash bucket. Re-ingesting a file replaces its earlier output.
+
+    Args:
+        raw_file (str): Path to raw data CSV file
+        store_dir (str): Root directory of the Parquet store
+        n_buckets (int, optional): Number of device ID hash buckets. Defaults to 16.
+        chunk_size (int, optional): Number of raw rows read per chunk. Defaults to 100000.
+
+    Returns:
+        int: Number of records written
+    """
+    store_dir = Path(store_dir)
+    raw_stem = Path(raw_file).stem
+
+    # Remove output from an earlier ingest of the same file, matching the exact part name so
+    # that parts of a raw file whose stem merely starts with '<raw_stem>-' are kept
+    part_name = re.compile(rf"^{re.escape(raw_stem)}-\d{{5}}-\d+\.parquet$")
+    for old_file in store_dir.glob("*/*/*.parquet"):
+        if part_name.match(old_file.name):
+            old_file.unlink()
+
+    column_map = {'表号': 'device_id', '数据': 'data'}
+    dtype_map = {'表号': str, '数据': str}
+    chunks = pd.read_csv(raw_file, chunksize=chunk_size, usecols=list(column_map.keys()),
+                         dtype=dtype_map, encoding='gbk')
+
+    n_records = 0
+    for chunk_index, chunk in enumerate(chunks):
+        chunk = chunk.rename(columns=column_map).dropna(subset=['device_id'])
+        chunk['date'] = extract_pulse_dates(chunk['data'].fillna(''))
+        chunk['month'] = pulse_date_months(chunk['date'])
+        chunk['bucket'] = device_buckets(chunk['device_id'], n_buckets)
+
+        table = pa.Table.from_pandas(chunk[RECORD_SCHEMA.names], schema=RECORD_SCHEMA, preserve_index=False)
+        pq.write_to_dataset(table, root_path=str(store_dir), partitioning=PARTITIONING,
+                            basename_template=f"{raw_stem}-{chunk_index:05d}-{{i}}.parquet",
+                            existing_data_behavior='overwrite_or_ignore')
+        n_records += len(chunk)
+
+    return n_records
+
+def read_pulse_store(store_dir: str, device_pairs: pd.DataFrame,
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read the records for specific device-days from the Parquet store.
+
+    Only the month and bucket partitions that can hold the requested device-days are
+    opened, and the device and date filters are pushed down to the Parquet reader.
+
+    Args:
+        store_dir (str): Root directory of the Parquet store
+        device_pairs (pd.DataFrame): Requested raw 'device_id' and pulse 'date' pairs
+        columns (Optional[List[str]]): Columns to read. Defaults to 'device_id', 'date', 'data'.
+
+    Returns:
+        pd.DataFrame: Records matching a requested (device_id, date) pair
+    """
+    metadata = load_store_metadata(store_dir)
+    if not metadata:
+        raise FileNotFoundError(f"Pulse store not found: {store_dir}")
+
+    columns = columns or ['device_id', 'date', 'data']
+    pairs = device_pairs[['device_id', 'date']].drop_duplicates(ignore_index=True)
+    if pairs.empty:
+        return pd.DataFrame(columns=columns)
+
+    months = pulse_date_months(pairs['date']).unique().tolist()
+    buckets = np.unique(device_buckets(pairs['device_id'], metadata['n_buckets'])).tolist()
+
+    # Read with the record schema rather than the first file's, which also casts parts written
+    # before the schema was fixed
+    dataset = ds.dataset(str(store_dir), format='parquet', partitioning=PARTITIONING,
+                         schema=RECORD_SCHEMA, exclude_invalid_files=True)
+    predicate = (ds.field('month').isin(months)
+                 & ds.field('bucket').isin(buckets)
+                 & ds.field('device_id').isin(pairs['device_id'].unique().tolist())
+                 & ds.field('date').isin(pairs['date'].unique().tolist()))
+    read_columns = list(dict.fromkeys(columns + ['device_id', 'date']))
+    records = dataset.to_table(columns=read_columns, filter=predicate).to_pandas()
+
+    # Devices and dates were filtered independently; keep only the requested pairs
+    records = records.merge(pairs, on=['device_id', 'date'], how='inner')
+    return records[columns]
+
+def ingest_raw_files(raw_files: List[Path], store_dir: str, n_buckets: int = DEFAULT_N_BUCKETS,
+                     workers: int = 1):
+    """Ingest several raw files into the store, optionally in a process pool.
+
+    Args:
+        raw_files (List[Path]): Raw data CSV files
+        store_dir (str): Root directory of the Parquet store
+        n_buckets (int, optional): Number of device ID hash buckets. Defaults to 16.
+        workers (int, optional): Number of worker processes. Defaults to 1.
+    """
+    store_dir = Path(store_dir)
+    metadata = load_store_metadata(str(store_dir))
+    if metadata and metadata['n_buckets'] != n_buckets:
+        raise ValueError(f"Store {store_dir} was created with {metadata['n_buckets']} buckets, "
+                         f"got {n_buckets}")
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    with open(store_dir / METADATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'n_buckets': n_buckets}, f, indent=2)
+
+    successful = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_raw_file, str(raw_file), str(store_dir), n_buckets): raw_file
+                   for raw_file in raw_files}
+        for future in as_completed(futures):
+            raw_file = futures[future]
+            try:
+                n_records = future.result()
+                print(f"✓ Ingested {raw_file.name}: {n_records} records")
+                successful += 1
+            except Exception as e:
+                print(f"✗ Error ingesting {raw_file.name}: {str(e)}")
+                failed += 1
+
+    print("\nIngest Summary:")
+    print(f"Total files: {len(raw_files)}")
+    print(f"Successful: {successful}")
+    print(f"Failed: {failed}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert raw GBK pulse exports into a partitioned Parquet store.")
+    parser.add_argument('raw_files', nargs='*', help="Raw files to ingest (default: data/raw/2024*_*.csv)")
+    parser.add_argument('--store', default=str(DEFAULT_STORE_DIR), help="Store directory")
+    parser.add_argument('--buckets', type=int, default=DEFAULT_N_BUCKETS, help="Number of device ID hash buckets")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (default: 1)")
+    args = parser.parse_args()
+
+    raw_files = [Path(f) for f in args.raw_files] or sorted(Path('data/raw').glob('2024*_*.csv'))
+    if not raw_files:
+        print("No matching CSV files found to ingest")
+    else:
+        ingest_raw_files(raw_files, args.store, args.buckets, args.workers)
@@ -0,0 +1,176 @@
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Tuple
+from generate_simulated_data import add_perturbation, calculate_pulse_counts, aggregate_per_minute
+
+# Ranges the household parameters are drawn from. Rates are in m³/hour, durations in seconds.
+LEAK_PROBABILITY = 0.5
+LEAK_RATE_RANGE = (0.01, 0.2)            # log-uniform, covers the 0.05 m³/h micro-leak
+STOVE_RATE_RANGE = (0.1, 0.4)
+STOVE_SESSIONS_PER_DAY = 3.0             # Poisson mean
+STOVE_DURATION_RANGE = (300, 2700)
+HEATER_RATE_RANGE = (0.8, 1.6)
+HEATER_SESSIONS_PER_DAY = 4.0            # Poisson mean
+HEATER_DURATION_RANGE = (60, 900)
+LONG_AMPLITUDE_RANGE = (0.0, 0.06)
+SHORT_AMPLITUDE_RANGE = (0.0, 0.004)
+CHAMBER_VOLUMES = (0.005, 0.01, 0.02)
+
+def sample_household_parameters(rng: np.random.Generator, n_households: int) -> pd.DataFrame:
+    """
+    Draw the per-household simulation parameters.
+    :param rng: Random generator.
+    :param n_households: Number of households.
+    :return: DataFrame with one row of parameters per household.
+    """
+    leak = rng.random(n_households) < LEAK_PROBABILITY
+    leak_rate = np.exp(rng.uniform(np.log(LEAK_RATE_RANGE[0]), np.log(LEAK_RATE_RANGE[1]), n_households))
+
+    return pd.DataFrame({
+        'leak': leak,
+        'leak_rate': np.where(leak, leak_rate, 0.0),
+        'stove_rate': rng.uniform(*STOVE_RATE_RANGE, n_households),
+        'heater_rate': rng.uniform(*HEATER_RATE_RANGE, n_households),
+        'long_amplitude': rng.uniform(*LONG_AMPLITUDE_RANGE, n_households),
+        'short_amplitude': rng.uniform(*SHORT_AMPLITUDE_RANGE, n_households),
+        'chamber_volume': rng.choice(CHAMBER_VOLUMES, n_households)
+    })
+
+def schedule_appliance_flow(rng: np.random.Generator, rates: np.ndarray, duration: int,
+                            sessions_per_day: float, duration_range: Tuple[int, int]) -> np.ndarray:
+    """
+    Build per-second flow rates of an appliance used in randomly placed sessions.
+    Sessions of all households are laid down at once with a difference array.
+    :param rng: Random generator.
+    :param rates: Flow rate of the appliance per household (m³/s).
+    :param duration: Simulated duration (s).
+    :param sessions_per_day: Mean number of sessions per day.
+    :param duration_range: Range of session lengths (s).
+    :return: Flow rates of shape (households, duration) in m³/s.
+    """
+    n_households = len(rates)
+    n_sessions = rng.poisson(sessions_per_day * duration / 86400, n_households)
+    households = np.repeat(np.arange(n_households), n_sessions)
+    starts = rng.integers(0, duration, len(households))
+    ends = np.minimum(starts + rng.integers(*duration_range, len(households)), duration)
+
+    delta = np.zeros((n_households, duration + 1))
+    np.add.at(delta, (households, starts), rates[households])
+    np.add.at(delta, (households, ends), -rates[households])
+
+    # Overlapping sessions add up; clip round-off left behind where sessions end
+    return np.maximum(np.cumsum(delta[:, :duration], axis=1), 0.0)
+
+def simulate_household_chunk(seed: np.random.SeedSequence, n_households: int,
+                             duration: int) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Simulate a chunk of households.
+    :param seed: Seed sequence of this chunk.
+    :param n_households: Number of households in the chunk.
+    :param duration: Simulated duration (s).
+    :return: Per-minute pulse counts of shape (households, minutes) and household parameters.
+    """
+    rng = np.random.default_rng(seed)
+    params = sample_household_parameters(rng, n_households)
+    time_seconds = np.arange(duration)
+
+    flow_rates = np.repeat((params['leak_rate'].to_numpy() / 3600)[:, None], duration, axis=1)
+    flow_rates += schedule_appliance_flow(rng, params['stove_rate'].to_numpy() / 3600, duration,
+                                          STOVE_SESSIONS_PER_DAY, STOVE_DURATION_RANGE)
+    flow_rates += schedule_appliance_flow(rng, params['heater_rate'].to_numpy() / 3600, duration,
+                                          HEATER_SESSIONS_PER_DAY, HEATER_DURATION_RANGE)
+    flow_rates = add_perturbation(flow_rates, time_seconds,
+                                  params['long_amplitude'].to_numpy()[:, None],
+                                  params['short_amplitude'].to_numpy()[:, None])
+
+    # Households sharing a chamber volume are counted in one batch
+    pulse_counts = np.zeros_like(flow_rates)
+    chamber_volumes = params['chamber_volume'].to_numpy()
+    for chamber_volume in np.unique(chamber_volumes):
+        rows = chamber_volumes == chamber_volume
+        pulse_counts[rows] = calculate_pulse_counts(flow_rates[rows], chamber_volume, 1)
+
+    return aggregate_per_minute(pulse_counts).astype(np.int16), params
+
+def _simulate_and_save(chunk_id: int, seed: np.random.SeedSequence, n_households: int,
+                       duration: int, output_dir: str) -> pd.DataFrame:
+    """
+    Simulate one chunk and write its pulse series to 'chunk_<id>.npz'.
+    :return: Household parameters with the chunk file and row of each household.
+    """
+    pulses, params = simulate_household_chunk(seed, n_households, duration)
+
+    chunk_file = f"chunk_{chunk_id:05d}.npz"
+    np.savez(Path(output_dir) / chunk_file, pulses=pulses, leak=params['leak'].to_numpy())
+
+    params.insert(0, 'chunk_file', chunk_file)
+    params.insert(1, 'chunk_row', np.arange(n_households))
+    return params
+
+def simulate_households(n_households: int, duration: int = 86400, output_dir: str = 'data/processed/simulated_households',
+                        chunk_size: int = 32, workers: int = 1, seed: int = 0) -> pd.DataFrame:
+    """
+    Simulate a population of synthetic households and write labeled per-minute pulse series.
+    Every chunk draws from its own child of one SeedSequence, so the output only depends on
+    the seed and chunk size, never on the number of workers.
+    :param n_households: Number of households.
+    :param duration: Simulated duration per household (s).
+    :param output_dir: Directory for the chunk files and 'households.csv'.
+    :param chunk_size: Households simulated together; bounds the memory of a worker.
+    :param workers: Number of worker processes.
+    :param seed: Root seed.
+    :return: Household parameters and labels, one row per household.
+    """
+    if n_households < 1:
+        raise ValueError(f"n_households must be at least 1, got {n_households}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    chunk_sizes = [min(chunk_size, n_households - start) for start in range(0, n_households, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = list(executor.map(_simulate_and_save, range(len(chunk_sizes)), seeds, chunk_sizes,
+                                   [duration] * len(chunk_sizes), [str(output_dir)] * len(chunk_sizes)))
+
+    households = pd.concat(chunks, ignore_index=True)
+    households.insert(0, 'household_id', np.arange(len(households)))
+    households.to_csv(output_dir / 'households.csv', index=False)
+
+    return households
+
+def load_simulated_households(output_dir: str = 'data/processed/simulated_households') -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Load simulated households written by simulate_households.
+    :param output_dir: Output directory of the simulation.
+    :return: Per-minute pulse counts of shape (households, minutes) and household parameters.
+    """
+    output_dir = Path(output_dir)
+    households = pd.read_csv(output_dir / 'households.csv')
+
+    pulses = []
+    for chunk_file in households['chunk_file'].unique():
+        with np.load(output_dir / chunk_file) as chunk:
+            pulses.append(chunk['pulses'])
+
+    return np.concatenate(pulses), households
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a population of synthetic households.")
+    parser.add_argument('--households', type=int, default=1000, help="Number of households")
+    parser.add_argument('--duration', type=int, default=86400, help="Simulated seconds per household")
+    parser.add_argument('--chunk-size', type=int, default=32, help="Households per chunk")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Root random seed")
+    parser.add_argument('--output', default='data/processed/simulated_households', help="Output directory")
+    args = parser.parse_args()
+
+    households = simulate_households(args.households, args.duration, args.output,
+                                     args.chunk_size, args.workers, args.seed)
+    print(f"Simulated households: {len(households)}")
+    print(f"Leak households: {int(households['leak'].sum())}")
+    print(f"Data saved to {args.output}")
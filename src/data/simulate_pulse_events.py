@@ -0,0 +1,136 @@
+import argparse
+import time
+import numpy as np
+from typing import Tuple
+from generate_simulated_data import add_perturbation, calculate_event_flow_rates
+
+def piecewise_constant_pulse_times(breakpoints: np.ndarray, rates: np.ndarray, duration: float,
+                                   chamber_volume: float) -> np.ndarray:
+    """
+    Compute pulse instants of a piecewise-constant flow by inverting its cumulative volume.
+    Within a segment the volume grows linearly, so the instant a pulse threshold is crossed
+    follows in closed form. The cost depends on the number of pulses and segments, not on
+    the duration.
+    :param breakpoints: Ascending segment start times (s); the first one is 0.
+    :param rates: Flow rate of every segment (m³/s).
+    :param duration: End of the last segment (s).
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :return: Pulse instants (s) in ascending order.
+    """
+    breakpoints = np.asarray(breakpoints, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    segment_ends = np.append(breakpoints[1:], duration)
+    volume_at_end = np.cumsum(rates * (segment_ends - breakpoints))
+    volume_at_start = volume_at_end - rates * (segment_ends - breakpoints)
+
+    n_pulses = int(volume_at_end[-1] // chamber_volume) if len(volume_at_end) else 0
+    pulse_volumes = chamber_volume * np.arange(1, n_pulses + 1)
+
+    # First segment whose end volume reaches the threshold; its rate is necessarily positive
+    segments = np.searchsorted(volume_at_end, pulse_volumes, side='left')
+    return breakpoints[segments] + (pulse_volumes - volume_at_start[segments]) / rates[segments]
+
+def sampled_pulse_times(time_points: np.ndarray, flow_rates: np.ndarray, chamber_volume: float) -> np.ndarray:
+    """
+    Compute pulse instants of a sampled flow curve.
+    The cumulative volume is integrated with the trapezoidal rule and the pulse thresholds
+    are located on it with searchsorted, interpolating linearly between samples.
+    :param time_points: Ascending sample times (s).
+    :param flow_rates: Flow rate at every sample time (m³/s).
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :return: Pulse instants (s) in ascending order.
+    """
+    time_points = np.asarray(time_points, dtype=np.float64)
+    flow_rates = np.asarray(flow_rates, dtype=np.float64)
+    cumulative_volume = np.concatenate(([0.0], np.cumsum(np.diff(time_points) * (flow_rates[1:] + flow_rates[:-1]) / 2)))
+
+    n_pulses = int(cumulative_volume[-1] // chamber_volume)
+    pulse_volumes = chamber_volume * np.arange(1, n_pulses + 1)
+
+    # Thresholds fall in (volume[k - 1], volume[k]], an interval of positive width
+    upper = np.searchsorted(cumulative_volume, pulse_volumes, side='left')
+    lower = upper - 1
+    fraction = (pulse_volumes - cumulative_volume[lower]) / (cumulative_volume[upper] - cumulative_volume[lower])
+    return time_points[lower] + fraction * (time_points[upper] - time_points[lower])
+
+def bin_pulse_times(pulse_times: np.ndarray, duration: float, resolution: float = 60) -> np.ndarray:
+    """
+    Count pulses per time bin. Bins are closed on the right, like the time steps of
+    calculate_pulse_counts: a pulse at instant t falls into bin ceil(t / resolution) - 1.
+    :param pulse_times: Pulse instants (s).
+    :param duration: Duration covered by the bins (s).
+    :param resolution: Bin length (s), e.g. 1 for per-second or 60 for per-minute counts.
+    :return: Pulse counts per bin.
+    """
+    n_bins = int(np.ceil(duration / resolution))
+    pulse_times = np.asarray(pulse_times)
+    pulse_times = pulse_times[(pulse_times > 0) & (pulse_times <= duration)]
+    bins = np.ceil(pulse_times / resolution).astype(np.int64) - 1
+    return np.bincount(bins, minlength=n_bins)
+
+def event_rate_segments(duration: int, leak_rate: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Describe the three events of generate_flow_data as constant-rate segments.
+    :param duration: Simulated duration (s).
+    :param leak_rate: Micro-leak flow rate (m³/h); 0.05 matches generate_flow_data.
+    :return: Segment start times (s) and flow rates (m³/s).
+    """
+    period_length = duration // 6
+    edges = [0, int(3 * duration / 5), int(4 * duration / 5)]
+    for start in range(duration // 2, duration, period_length):
+        edges += [start, start + int(0.2 * period_length)]
+    breakpoints = np.unique([edge for edge in edges if edge < duration])
+
+    # The events are constant between edges, so evaluating them at the edges is enough
+    event1_rate, event2_rate, event3_rate = calculate_event_flow_rates(breakpoints, duration)
+    rates = event1_rate * (leak_rate / 0.05) + event2_rate + event3_rate
+    return breakpoints, rates
+
+def simulate_pulse_counts(duration: int = 3600, chamber_volume: float = 0.01, leak_rate: float = 0.05,
+                          superposition: bool = True, perturbation: bool = False,
+                          resolution: float = 60) -> np.ndarray:
+    """
+    Simulate binned pulse counts event by event.
+    Without perturbation the flow is piecewise constant and inverted exactly; with it, the
+    perturbed flow is sampled once per second.
+    :param duration: Simulated duration (s).
+    :param chamber_volume: Volume of the metering chamber (m³).
+    :param leak_rate: Micro-leak flow rate (m³/h).
+    :param superposition: Whether to add the gas stove and water heater events to the leak.
+    :param perturbation: Whether to apply add_perturbation to the flow.
+    :param resolution: Bin length (s).
+    :return: Pulse counts per bin.
+    """
+    if superposition:
+        breakpoints, rates = event_rate_segments(duration, leak_rate)
+    else:
+        breakpoints, rates = np.array([0]), np.array([leak_rate / 3600])
+
+    if perturbation:
+        time_points = np.arange(duration + 1)
+        segments = np.searchsorted(breakpoints, time_points, side='right') - 1
+        flow_rates = add_perturbation(rates[segments], time_points)
+        pulse_times = sampled_pulse_times(time_points, flow_rates, chamber_volume)
+    else:
+        pulse_times = piecewise_constant_pulse_times(breakpoints, rates, duration, chamber_volume)
+
+    return bin_pulse_times(pulse_times, duration, resolution)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate meter pulses event by event.")
+    parser.add_argument('--duration', type=int, default=365 * 86400, help="Simulated duration in seconds")
+    parser.add_argument('--chamber-volume', type=float, default=0.01, help="Chamber volume in m³")
+    parser.add_argument('--leak-rate', type=float, default=0.05, help="Micro-leak flow rate in m³/h")
+    parser.add_argument('--resolution', type=float, default=3600, help="Bin length in seconds")
+    parser.add_argument('--superposition', action='store_true', help="Add the gas stove and water heater events")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = simulate_pulse_counts(args.duration, args.chamber_volume, args.leak_rate,
+                                   args.superposition, resolution=args.resolution)
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated duration: {args.duration} s")
+    print(f"Total pulses: {int(counts.sum())}")
+    print(f"Bins: {len(counts)} of {args.resolution:g} s")
+    print(f"Time: {elapsed:.3f} s")
@@ -1,14 +1,96 @@
+import os
 import json
+import atexit
+import weakref
+import tempfile
 import pandas as pd
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class FileLock:
+    """Exclusive inter-process lock held on a sidecar lock file."""
+    
+    def __init__(self, file_path: str):
+        self.file_path = Path(file_path)
+        self._file = None
+    
+    def __enter__(self):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.file_path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after 10 seconds; keep waiting
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+# The journal is folded into the dictionary file at the latest once it holds this many entries
+# and half of all codes, so appending stays O(1) amortized
+COMPACT_MIN_ENTRIES = 1000
+
+# Managers whose journal is folded into the dictionary file when the interpreter exits
+_open_managers: 'weakref.WeakSet[EncodingDictManager]' = weakref.WeakSet()
+
+@atexit.register
+def _flush_open_managers():
+    for manager in list(_open_managers):
+        try:
+            manager.flush()
+        except OSError:
+            pass  # The journal is kept and replayed by the next manager
 
 class EncodingDictManager:
-    """Manages shared encoding dictionaries across different scripts."""
+    """Manages shared encoding dictionaries across different scripts and processes.
+    
+    Lookups of known values are served from memory. New codes are only allocated while
+    holding an exclusive lock on '<file>.lock', after picking up the codes other processes
+    added, so concurrent processes never lose each other's codes or hand out the same code twice.
+    
+    New codes are appended to the journal '<file>.log' when the lock is released: immediately
+    for a single call, or at the end of a ``batch()`` block, which holds the lock for its whole
+    duration. The dictionary file is only re-read when its size or mtime changed; otherwise just
+    the new journal entries are. The journal is folded into the dictionary file, which is
+    replaced atomically, at the end of every batch, when it holds half of all codes, on
+    ``flush()`` and when the interpreter exits.
+    """
     
     def __init__(self, file_path: Optional[str] = None):
         self.file_path = Path(file_path) if file_path else Path('data/interim/encoding_dicts.json')
-        self.encoding_dicts = self._load_dicts()
+        self.journal_path = self.file_path.with_name(self.file_path.name + '.log')
+        self.lock = FileLock(self.file_path.with_name(self.file_path.name + '.lock'))
+        self.encoding_dicts: Dict[str, Dict[str, str]] = {}
+        self._used_codes: Dict[str, Set[str]] = {}
+        self._next_index: Dict[str, int] = {}
+        self._lock_depth = 0
+        self._compact_on_release = False
+        self._pending: List[Tuple[str, str, str]] = []
+        self._loaded = False
+        self._file_stat: Optional[Tuple[int, int, int]] = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._refresh()
+        _open_managers.add(self)
     
     def _load_dicts(self) -> Dict[str, Dict[str, str]]:
         """Load existing encoding dictionaries or create new ones."""
@@ -24,11 +106,157 @@ class EncodingDictManager:
             'annotation': {}
         }
     
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+    
+    def _refresh(self):
+        """Pick up codes added by other processes: re-read the dictionary file if it was
+        replaced, then apply the journal entries not applied yet."""
+        # Stat before reading, so a file replaced in between is re-read next time
+        file_stat = self._stat(self.file_path)
+        if not self._loaded or file_stat != self._file_stat:
+            self.encoding_dicts = self._load_dicts()
+            self._loaded = True
+            self._file_stat = file_stat
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._used_codes.clear()
+            self._next_index.clear()
+        
+        try:
+            with open(self.journal_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self._journal_offset:
+                    # Replaced without the dictionary file changing; start over
+                    self._loaded = False
+                    return self._refresh()
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._journal_offset = self._journal_entries = 0
+            return
+        
+        # Only whole lines; a line being written by another process is read next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                category, value, code = json.loads(line)
+            except ValueError:
+                continue  # Left by a writer that was interrupted
+            self.encoding_dicts.setdefault(category, {})[value] = code
+            if category in self._used_codes:
+                self._used_codes[category].add(code)
+            self._journal_entries += 1
+        self._journal_offset += end
+    
+    def _append_journal(self, entries: List[Tuple[str, str, str]]):
+        """Append new codes to the journal. Called while holding the lock."""
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() != self._journal_offset:
+                data = b'\n' + data  # Terminate a line left incomplete by an interrupted writer
+            f.write(data)
+            self._journal_offset = f.tell()
+        self._journal_entries += len(entries)
+    
     def save_dicts(self):
-        """Save encoding dictionaries to file."""
+        """Save encoding dictionaries to file, replacing it atomically, and empty the journal.
+        Called while holding the lock."""
         self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.encoding_dicts, f, ensure_ascii=False, indent=2)
+        fd, tmp_path = tempfile.mkstemp(dir=self.file_path.parent, prefix=self.file_path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.encoding_dicts, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # The dictionary file now holds every journal entry
+        self.journal_path.unlink(missing_ok=True)
+        self._file_stat = self._stat(self.file_path)
+        self._journal_offset = self._journal_entries = 0
+    
+    @contextmanager
+    def _locked(self, compact: bool):
+        """Hold the dictionary lock, up to date with other processes, and persist the new codes
+        on release: to the dictionary file if compact, else to the journal."""
+        outermost = self._lock_depth == 0
+        if outermost:
+            self.lock.__enter__()
+            try:
+                self._refresh()
+            except BaseException:
+                self.lock.__exit__(None, None, None)
+                raise
+            self._compact_on_release = compact
+        self._lock_depth += 1
+        try:
+            yield self
+        finally:
+            self._lock_depth -= 1
+            if outermost:
+                try:
+                    if self._pending:
+                        n_codes = sum(len(codes) for codes in self.encoding_dicts.values())
+                        journal_entries = self._journal_entries + len(self._pending)
+                        if self._compact_on_release or journal_entries >= max(COMPACT_MIN_ENTRIES, n_codes // 2):
+                            self.save_dicts()
+                        else:
+                            self._append_journal(self._pending)
+                        self._pending = []
+                finally:
+                    self.lock.__exit__(None, None, None)
+    
+    @contextmanager
+    def batch(self):
+        """Hold the dictionary lock and defer saving new codes until the end of the block,
+        where they are written to the dictionary file once.
+        
+        Example:
+            with manager.batch():
+                for value in values:
+                    manager.get_or_create_encoding('device_id', value)
+        """
+        with self._locked(compact=True):
+            yield self
+    
+    def flush(self):
+        """Fold the journal into the dictionary file, for readers of the file itself."""
+        with self._locked(compact=False):
+            if self._journal_offset > 0:
+                self.save_dicts()
+    
+    def _allocate_code(self, category: str) -> str:
+        """Allocate the next free code of a category in O(1) amortized time.
+        
+        Codes are numbered from the dictionary size onwards, skipping codes already in use,
+        so the result matches rebuilding the set of existing codes on every call.
+        """
+        if category not in self._used_codes:
+            self._used_codes[category] = set(self.encoding_dicts[category].values())
+            self._next_index[category] = len(self.encoding_dicts[category]) + 1
+        
+        used_codes = self._used_codes[category]
+        index = self._next_index[category]
+        new_code = f"{category[0].upper()}{index:03d}"
+        while new_code in used_codes:
+            index += 1
+            new_code = f"{category[0].upper()}{index:03d}"
+        
+        used_codes.add(new_code)
+        self._next_index[category] = index + 1
+        return new_code
+    
+    def _add_code(self, category: str, value: str) -> str:
+        """Allocate and record the code of a new value. Called while holding the lock."""
+        code = self._allocate_code(category)
+        self.encoding_dicts[category][value] = code
+        self._pending.append((category, value, code))
+        return code
     
     def get_or_create_encoding(self, category: str, value: str) -> str:
         """Get existing encoding or create new one for a value.
@@ -47,18 +275,46 @@ class EncodingDictManager:
         # Convert value to string for consistency
         value = str(value).strip()
         
+        # Known values never change code, so they can be served without the lock
+        if value in self.encoding_dicts.get(category, {}):
+            return self.encoding_dicts[category][value]
+        
         # Create new encoding if value doesn't exist
-        if value not in self.encoding_dicts[category]:
-            existing_codes = set(self.encoding_dicts[category].values())
-            new_code = f"{category[0].upper()}{len(self.encoding_dicts[category]) + 1:03d}"
+        with self._locked(compact=False):
+            encoding_dict = self.encoding_dicts.setdefault(category, {})
+            if value not in encoding_dict:
+                self._add_code(category, value)
             
-            while new_code in existing_codes:
-                new_code = f"{category[0].upper()}{int(new_code[1:]) + 1:03d}"
+            return encoding_dict[value]
+    
+    def encode_series(self, category: str, series: pd.Series) -> pd.Series:
+        """Encode a whole column in one pass.
+        
+        New values get codes in order of first appearance, exactly as calling
+        get_or_create_encoding row by row would, and the dictionaries are saved at most once.
+        
+        Args:
+            category (str): Category of the encoding (e.g., 'device_id', 'annotation')
+            series (pd.Series): Values to be encoded
             
-            self.encoding_dicts[category][value] = new_code
-            self.save_dicts()
+        Returns:
+            pd.Series: Encoded values, 'MISSING' for empty/NaN values
+        """
+        missing = series.isna() | (series.astype(str) == '')
+        values = series[~missing].astype(str).str.strip()
+        unique_values = pd.unique(values)
+        
+        encoding_dict = self.encoding_dicts.get(category, {})
+        if any(value not in encoding_dict for value in unique_values):
+            with self.batch():
+                encoding_dict = self.encoding_dicts.setdefault(category, {})
+                for value in unique_values:
+                    if value not in encoding_dict:
+                        self._add_code(category, value)
         
-        return self.encoding_dicts[category][value]
+        encoded = pd.Series('MISSING', index=series.index, dtype=object)
+        encoded[~missing.to_numpy()] = values.map(encoding_dict).to_numpy()
+        return encoded
     
     def get_encoding_dict(self, category: str) -> Dict[str, str]:
         """Get the encoding dictionary for a specific category."""
@@ -79,3 +335,25 @@ def map_label(label: str) -> str:
         '未': 'UNCERTAIN'    # Inconclusive inspection
     }
     return label_mapping.get(label, 'UNKNOWN') 
+
+def write_csv_if_changed(df: pd.DataFrame, output_path: str) -> bool:
+    """Write a dataframe to CSV unless the file already holds the same content.
+    
+    Leaving an unchanged file untouched keeps its modification time, so pipeline stages
+    that depend on it are not rerun.
+    
+    Args:
+        df (pd.DataFrame): Dataframe to write
+        output_path (str): Path of the CSV file
+        
+    Returns:
+        bool: True if the file was written
+    """
+    content = df.to_csv(index=False).encode('utf-8')
+    output_path = Path(output_path)
+    if output_path.exists() and output_path.read_bytes() == content:
+        return False
+    
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(content)
+    return True
@@ -0,0 +1,141 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Tuple
+
+def metrics_from_counts(tp, fp, tn, fn) -> Dict[str, np.ndarray]:
+    """
+    Accuracy, precision, recall and F1 from confusion counts.
+
+    Parameters:
+    tp, fp, tn, fn (array-like): Confusion counts, scalars or arrays of the same shape.
+
+    Returns:
+    dict: 'accuracy', 'precision', 'recall' and 'f1' arrays; undefined ratios are 0.
+    """
+    tp, fp, tn, fn = (np.asarray(count, dtype=np.float64) for count in (tp, fp, tn, fn))
+    accuracy = (tp + tn) / (tp + tn + fp + fn)
+    precision = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros_like(tp), where=(tp + fn) > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(tp), where=(precision + recall) > 0)
+    return {'accuracy': accuracy, 'precision': precision, 'recall': recall, 'f1': f1}
+
+def resampled_auc(labels: np.ndarray, levels: np.ndarray, n_levels: int) -> np.ndarray:
+    """
+    ROC AUC of every resample, from per-level label counts instead of sorting each resample.
+
+    Parameters:
+    labels (np.ndarray): Resampled labels of shape (resamples, n).
+    levels (np.ndarray): Resampled dense score ranks (0 = lowest score) of shape (resamples, n).
+    n_levels (int): Number of distinct scores.
+
+    Returns:
+    np.ndarray: AUC per resample, NaN where a resample holds only one class.
+    """
+    n_resamples = len(labels)
+    bins = (np.arange(n_resamples)[:, None] * n_levels + levels).ravel()
+    positives = np.bincount(bins, weights=labels.ravel(), minlength=n_resamples * n_levels)
+    totals = np.bincount(bins, minlength=n_resamples * n_levels)
+    positives = positives.reshape(n_resamples, n_levels)
+    negatives = totals.reshape(n_resamples, n_levels) - positives
+
+    # Each positive beats the negatives at lower levels and ties half of those at its level
+    negatives_below = np.cumsum(negatives, axis=1) - negatives
+    wins = (positives * (negatives_below + 0.5 * negatives)).sum(axis=1)
+    pairs = positives.sum(axis=1) * negatives.sum(axis=1)
+    return np.divide(wins, pairs, out=np.full(n_resamples, np.nan), where=pairs > 0)
+
+def bootstrap_chunk(seed: np.random.SeedSequence, y_true: np.ndarray, predictions: Dict[str, np.ndarray],
+                    levels: np.ndarray | None, n_levels: int, n_resamples: int) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Compute the metrics of one chunk of resamples drawn as a single index matrix.
+
+    Parameters:
+    seed (np.random.SeedSequence): Seed of this chunk.
+    y_true (np.ndarray): True labels (0/1).
+    predictions (dict): Boolean predictions per model.
+    levels (np.ndarray | None): Dense score ranks for the AUC, or None to skip it.
+    n_levels (int): Number of distinct scores.
+    n_resamples (int): Number of resamples in the chunk.
+
+    Returns:
+    dict: Metric arrays of length n_resamples per model, plus 'auc' under the key 'scores'.
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, len(y_true), size=(n_resamples, len(y_true)), dtype=np.int32)
+    labels = y_true[indices]
+    positives = labels.sum(axis=1)
+
+    results = {}
+    for name, predicted in predictions.items():
+        flagged = predicted[indices]
+        tp = (flagged & (labels == 1)).sum(axis=1)
+        fp = flagged.sum(axis=1) - tp
+        fn = positives - tp
+        tn = len(y_true) - tp - fp - fn
+        results[name] = metrics_from_counts(tp, fp, tn, fn)
+
+    if levels is not None:
+        results['scores'] = {'auc': resampled_auc(labels, levels[indices], n_levels)}
+    return results
+
+def bootstrap_metrics(y_true, predictions: Dict[str, np.ndarray], scores=None, n_resamples: int = 1000,
+                      workers: int = 1, seed: int = 0, chunk_size: int = 1000) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Bootstrap the evaluation metrics of several models at once.
+
+    Resamples are drawn in chunks, each from its own child of one SeedSequence, so the
+    result only depends on the seed and chunk size, never on the number of workers.
+
+    Parameters:
+    y_true (array-like): True labels (1 for leakage, 0 for no leakage).
+    predictions (dict): Boolean predictions per model name.
+    scores (array-like | None): Continuous scores for the AUC. Missing scores rank lowest.
+    n_resamples (int): Number of bootstrap resamples.
+    workers (int): Number of worker processes.
+    seed (int): Root seed.
+    chunk_size (int): Resamples per chunk; bounds the memory of the index matrix.
+
+    Returns:
+    dict: Per model name, arrays of 'accuracy', 'precision', 'recall' and 'f1' over the
+        resamples; with scores, also {'scores': {'auc': ...}}.
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    predictions = {name: np.asarray(predicted, dtype=bool) for name, predicted in predictions.items()}
+
+    levels, n_levels = None, 0
+    if scores is not None:
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64), nan=-np.inf)
+        distinct, levels = np.unique(scores, return_inverse=True)
+        n_levels = len(distinct)
+
+    chunk_sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    n_chunks = len(chunk_sizes)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(bootstrap_chunk, seeds, [y_true] * n_chunks, [predictions] * n_chunks,
+                                       [levels] * n_chunks, [n_levels] * n_chunks, chunk_sizes))
+    else:
+        chunks = [bootstrap_chunk(chunk_seed, y_true, predictions, levels, n_levels, size)
+                  for chunk_seed, size in zip(seeds, chunk_sizes)]
+
+    return {name: {metric: np.concatenate([chunk[name][metric] for chunk in chunks])
+                   for metric in chunks[0][name]}
+            for name in chunks[0]}
+
+def confidence_interval(samples: np.ndarray, level: float = 0.95) -> Tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval, ignoring undefined (NaN) resamples.
+
+    Parameters:
+    samples (np.ndarray): Bootstrap samples of a metric.
+    level (float): Confidence level.
+
+    Returns:
+    Tuple[float, float]: Lower and upper bound.
+    """
+    tail = (1 - level) / 2 * 100
+    low, high = np.nanpercentile(samples, [tail, 100 - tail])
+    return float(low), float(high)
@@ -1,13 +1,20 @@
-from pickle import TRUE
+import argparse
+from pathlib import Path
 import pandas as pd
-from datetime import datetime
-from sklearn.metrics import confusion_matrix, classification_report
 import numpy as np
 from sklearn.metrics import roc_curve, auc
 import matplotlib.pyplot as plt
 import seaborn as sns
+from bootstrap import bootstrap_metrics, confidence_interval, metrics_from_counts
+from pulse_hourly import get_pulse_hourly_path, load_pulse_hourly, save_pulse_hourly
+from stage_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, StageCache
 
-def merge_evaluation_with_model_output(eval_dataset_path: str, model_output_path: str, output_path: str | None = None):
+# Source files of the code computing the cached stages; editing any of them invalidates the cache
+STAGE_CODE = [str(Path(__file__).resolve().parent / module)
+              for module in ('evaluate.py', 'bootstrap.py', 'pulse_hourly.py', 'stage_cache.py')]
+
+def merge_evaluation_with_model_output(eval_dataset_path: str, model_output_path: str, output_path: str | None = None,
+                                       chunksize: int | None = None):
     """
     Merge evaluation dataset with model output based on device ID and date.
     
@@ -15,40 +22,47 @@ def merge_evaluation_with_model_output(eval_dataset_path: str, model_output_path
     eval_dataset_path (str): The file path of the evaluation dataset.
     model_output_path (str): The file path of the model output.
     output_path (str | None): The file path to save the merged dataset. If None, skip saving.
+    chunksize (int | None): Number of model output rows read at a time. If None, read the whole file.
+
+    The hourly pulse counts of the merged rows are written to a .npy sidecar next to
+    output_path, taken from the model output sidecar when there is one.
     """
     
-    # Load evaluation dataset
+    # Load evaluation dataset and parse the report dates once
     eval_df = pd.read_csv(eval_dataset_path, 
-                         usecols=['device_id_encoded', 'date_report', 'label'])
-    
-    # Load model output dataset
-    model_df = pd.read_csv(model_output_path,
-                          usecols=['device_id', 'date', 'score_likelihood', 'pulse_hourly'])
-    model_df['score_likelihood'] = pd.to_numeric(model_df['score_likelihood'], errors='coerce')
+                         usecols=['device_id_encoded', 'date_report', 'label'],
+                         dtype={'device_id_encoded': str})
+    eval_df['merge_date'] = pd.to_datetime(eval_df['date_report'], format='%Y/%m/%d')
+    eval_df['eval_row'] = np.arange(len(eval_df))
     
-    # Create merge keys
-    eval_df['merge_key'] = eval_df.apply(
-        lambda x: f"{x['device_id_encoded']}_{datetime.strptime(x['date_report'], '%Y/%m/%d').strftime('%Y-%m-%d')}", 
-        axis=1
-    )
-    # debug: check the merge key for device D894
-    print(eval_df[eval_df['device_id_encoded'] == 'D894']['merge_key'])
+    # Load model output dataset, optionally in chunks
+    model_chunks = pd.read_csv(model_output_path,
+                               usecols=['device_id', 'date', 'score_likelihood', 'pulse_hourly'],
+                               dtype={'device_id': str, 'date': str},
+                               chunksize=chunksize)
+    if chunksize is None:
+        model_chunks = [model_chunks]
     
-    model_df['merge_key'] = model_df.apply(
-        lambda x: f"{x['device_id']}_{x['date']}", 
-        axis=1
-    )
-    # debug: check the merge key for device D894
-    print(model_df[model_df['device_id'] == 'D894']['merge_key'])
+    # Merge datasets on the typed (device, date) key
+    merged_chunks = []
+    for model_df in model_chunks:
+        model_df['model_row'] = model_df.index
+        model_df['score_likelihood'] = pd.to_numeric(model_df['score_likelihood'], errors='coerce')
+        model_df['merge_date'] = pd.to_datetime(model_df['date'], format='%Y-%m-%d', errors='coerce')
+        model_df = model_df.dropna(subset=['merge_date'])
+        merged_chunks.append(pd.merge(
+            eval_df,
+            model_df,
+            left_on=['device_id_encoded', 'merge_date'],
+            right_on=['device_id', 'merge_date'],
+            how='inner'
+        ))
     
-    # Merge datasets
-    merged_df = pd.merge(
-        eval_df,
-        model_df,
-        on='merge_key',
-        how='inner'
-    )
- 
+    # Restore the evaluation row order; matches within a row keep the model output order
+    merged_df = pd.concat(merged_chunks, ignore_index=True)
+    merged_df = merged_df.sort_values('eval_row', kind='stable', ignore_index=True)
+    model_rows = merged_df['model_row'].to_numpy()
+    merged_df = merged_df.drop(columns=['merge_date', 'eval_row', 'model_row'])
 
     # replace the value of LABEL
     merged_df['label'] = merged_df['label'].replace({'NORMAL': 'NO_LEAKAGE'})
@@ -76,65 +90,187 @@ def merge_evaluation_with_model_output(eval_dataset_path: str, model_output_path
     # save to csv only if output_path is provided
     if output_path is not None:
         merged_df[cols].to_csv(output_path, index=False)
+        save_pulse_hourly(load_pulse_hourly(model_output_path, merged_df, rows=model_rows), output_path)
     
     return merged_df
 
-def calculate_model_performance():
-    """Calculate performance metrics for baseline and proposed models."""
+def threshold_sweep(y_true, scores) -> pd.DataFrame:
+    """
+    Evaluate the decision rule score >= threshold at every distinct score in one pass.
+
+    Scores are sorted once, and the confusion counts of all thresholds follow from cumulative
+    sums of the labels, so the sweep costs O(n log n). Missing scores are never flagged.
+
+    Parameters:
+    y_true (array-like): True labels (1 for leakage, 0 for no leakage).
+    scores (array-like): Model scores, e.g. score_by_proposed_model.
+
+    Returns:
+    pd.DataFrame: One row per distinct score in descending order, with 'threshold', 'tp', 'fp',
+        'tn', 'fn', 'inspections' (flagged rows), 'accuracy', 'precision', 'recall', 'f1' and
+        'fp_per_1000' (false positives per 1,000 inspections).
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    valid = ~np.isnan(scores)
+
+    order = np.argsort(-scores[valid], kind='stable')
+    sorted_scores = scores[valid][order]
+    sorted_labels = y_true[valid][order]
+
+    # Rows flagged at a threshold are all rows up to the last one with that score
+    last_of_score = np.flatnonzero(np.diff(sorted_scores, append=-np.inf) != 0)
+    tp = np.cumsum(sorted_labels)[last_of_score]
+    inspections = last_of_score + 1
+    fp = inspections - tp
+    positives = y_true.sum()
+    fn = positives - tp
+    tn = len(y_true) - positives - fp
+
+    sweep = pd.DataFrame({
+        'threshold': sorted_scores[last_of_score],
+        'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn,
+        'inspections': inspections
+    })
+    for name, values in metrics_from_counts(tp, fp, tn, fn).items():
+        sweep[name] = values
+    sweep['fp_per_1000'] = 1000 * fp / inspections
+    return sweep
+
+def counts_at_threshold(sweep: pd.DataFrame, threshold: float) -> pd.Series:
+    """
+    Confusion counts and metrics of the rule score >= threshold, read from a threshold sweep.
+
+    Parameters:
+    sweep (pd.DataFrame): Output of threshold_sweep.
+    threshold (float): Any threshold, not necessarily a distinct score.
+
+    Returns:
+    pd.Series: Row of the sweep at the lowest distinct score >= threshold.
+    """
+    # Flagged rows are the same as at the lowest distinct score at or above the threshold
+    above = np.flatnonzero(sweep['threshold'].to_numpy() >= threshold)
+    if len(above) == 0:
+        tp, fp = 0, 0
+        tn = int(sweep['tn'].iloc[0] + sweep['fp'].iloc[0])
+        fn = int(sweep['fn'].iloc[0] + sweep['tp'].iloc[0])
+        row = {'threshold': threshold, 'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn, 'inspections': 0}
+        row.update({name: float(value) for name, value in metrics_from_counts(tp, fp, tn, fn).items()})
+        row['fp_per_1000'] = 0.0
+        return pd.Series(row)
+    return sweep.iloc[above[-1]]
+
+def select_operating_point(sweep: pd.DataFrame, metric: str = 'f1', max_fp_per_1000: float | None = None,
+                           max_inspections: int | None = None, min_recall: float | None = None) -> pd.Series | None:
+    """
+    Pick the threshold that maximizes a metric under operational constraints.
+
+    Parameters:
+    sweep (pd.DataFrame): Output of threshold_sweep.
+    metric (str): Column to maximize, e.g. 'f1', 'recall' or 'tp'.
+    max_fp_per_1000 (float | None): Maximum false positives per 1,000 inspections.
+    max_inspections (int | None): Maximum number of flagged device-days, e.g. crew capacity.
+    min_recall (float | None): Minimum recall.
+
+    Returns:
+    pd.Series | None: The chosen row of the sweep, or None if no threshold meets the constraints.
+        Ties go to the highest threshold, which needs the fewest inspections.
+    """
+    feasible = np.ones(len(sweep), dtype=bool)
+    if max_fp_per_1000 is not None:
+        feasible &= sweep['fp_per_1000'].to_numpy() <= max_fp_per_1000
+    if max_inspections is not None:
+        feasible &= sweep['inspections'].to_numpy() <= max_inspections
+    if min_recall is not None:
+        feasible &= sweep['recall'].to_numpy() >= min_recall
+    if not feasible.any():
+        return None
+
+    candidates = sweep[feasible]
+    # The sweep is in descending threshold order, so idxmax returns the highest threshold on ties
+    return candidates.loc[candidates[metric].idxmax()]
+
+def calculate_model_performance(path: str = 'data/results/evaluation_dataset_with_model_output.csv',
+                                thresholds: tuple = (40, 60), n_bootstrap: int = 0, workers: int = 1, seed: int = 0):
+    """
+    Calculate performance metrics for baseline and proposed models.
+
+    Parameters:
+    path (str): The file path of the merged evaluation results.
+    thresholds (tuple): Score thresholds of the proposed model to report.
+    n_bootstrap (int): Number of bootstrap resamples for 95% confidence intervals. If 0, skip them.
+    workers (int): Number of worker processes for the bootstrap.
+    seed (int): Random seed of the bootstrap.
+
+    Returns:
+    dict: Confusion matrix, accuracy, precision, recall and F1-score per model, and with
+        n_bootstrap, their confidence intervals under '<metric> CI'.
+    """
     # Read the evaluation results
-    df = pd.read_csv('data/results/evaluation_dataset_with_model_output.csv')
-    
-    # Models to evaluate
-    models = {
-        'Baseline Model': 'baseline_model',
-        'Proposed Model (t=40)': 'proposed_model_40',
-        'Proposed Model (t=60)': 'proposed_model_60'
-    }
+    df = pd.read_csv(path, usecols=['label_encoded', 'baseline_model', 'score_by_proposed_model'])
+    y_true = df['label_encoded'].to_numpy()
+    scores = df['score_by_proposed_model'].to_numpy(dtype=np.float64)
+
+    # Predictions of every model; missing scores are never flagged
+    predictions = {'Baseline Model': df['baseline_model'].to_numpy(dtype=bool)}
+    for threshold in thresholds:
+        predictions[f'Proposed Model (t={threshold:g})'] = np.nan_to_num(scores, nan=-np.inf) >= threshold
+
+    # Confusion counts: the baseline flags, then one sweep for all thresholds
+    baseline = predictions['Baseline Model']
+    counts = {'Baseline Model': (np.sum(baseline & (y_true == 1)), np.sum(baseline & (y_true == 0)),
+                                 np.sum(~baseline & (y_true == 0)), np.sum(~baseline & (y_true == 1)))}
+    sweep = threshold_sweep(y_true, scores)
+    for threshold in thresholds:
+        row = counts_at_threshold(sweep, threshold)
+        counts[f'Proposed Model (t={threshold:g})'] = (row['tp'], row['fp'], row['tn'], row['fn'])
+
+    samples = bootstrap_metrics(y_true, predictions, n_resamples=n_bootstrap, workers=workers,
+                                seed=seed) if n_bootstrap > 0 else {}
     
     # Store results
     results = {}
     
-    for model_name, column in models.items():
-        # Get predictions and true labels
-        y_true = df['label_encoded']
-        y_pred = df[column].astype(int)
-        
-        # Calculate confusion matrix
-        tn, fp, fn, tp = confusion_matrix(y_true, y_pred).ravel()
-        
-        # Calculate metrics
-        accuracy = (tp + tn) / (tp + tn + fp + fn)
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-        
+    for model_name, (tp, fp, tn, fn) in counts.items():
+        metrics = metrics_from_counts(tp, fp, tn, fn)
         results[model_name] = {
-            'Confusion Matrix': confusion_matrix(y_true, y_pred),
-            'Accuracy': accuracy,
-            'Precision': precision,
-            'Recall': recall,
-            'F1-Score': f1
+            'Confusion Matrix': np.array([[tn, fp], [fn, tp]], dtype=np.int64),
+            'Accuracy': float(metrics['accuracy']),
+            'Precision': float(metrics['precision']),
+            'Recall': float(metrics['recall']),
+            'F1-Score': float(metrics['f1'])
         }
+        if model_name in samples:
+            for metric, key in [('Accuracy', 'accuracy'), ('Precision', 'precision'),
+                                ('Recall', 'recall'), ('F1-Score', 'f1')]:
+                results[model_name][f'{metric} CI'] = confidence_interval(samples[model_name][key])
     
     return results
 
-def get_roc_curve_data(eval_dataset_path: str, model_output_path: str):
+def get_roc_curve_data(eval_dataset_path: str, model_output_path: str, n_bootstrap: int = 0,
+                       workers: int = 1, seed: int = 0, merged_df: pd.DataFrame | None = None):
     """
     Get ROC curve data using continuous prediction scores.
 
     Parameters:
     eval_dataset_path (str): Path to the evaluation dataset.
     model_output_path (str): Path to the model output dataset.
+    n_bootstrap (int): Number of bootstrap resamples for a 95% AUC confidence interval. If 0, skip it.
+    workers (int): Number of worker processes for the bootstrap.
+    seed (int): Random seed of the bootstrap.
+    merged_df (pd.DataFrame | None): Result of merge_evaluation_with_model_output on the same
+        inputs, if already available. If None, merge them here.
 
     Returns:
-    dict: ROC curve data including FPR, TPR, and AUC
+    dict: ROC curve data including FPR, TPR, and AUC, and with n_bootstrap, 'auc_ci'
     """
     # Merge datasets
-    merged_df = merge_evaluation_with_model_output(
-        eval_dataset_path=eval_dataset_path,
-        model_output_path=model_output_path,
-        output_path=None  # Prevent saving during intermediate step
-    )
+    if merged_df is None:
+        merged_df = merge_evaluation_with_model_output(
+            eval_dataset_path=eval_dataset_path,
+            model_output_path=model_output_path,
+            output_path=None  # Prevent saving during intermediate step
+        )
     
     # Get true labels and scores
     y_true = merged_df['label_encoded']
@@ -145,23 +281,21 @@ def get_roc_curve_data(eval_dataset_path: str, model_output_path: str):
     fpr, tpr, thresholds = roc_curve(y_true, y_score)
     roc_auc = auc(fpr, tpr)
     
-    return {
+    roc_data = {
         'fpr': fpr,
         'tpr': tpr,
         'thresholds': thresholds,
         'auc': roc_auc
     }
-
-def plot_model_performance(results: dict, roc_data: dict, output_path: str | None = None):
-    """
-    Plot performance metrics and ROC curve following IEEE/ACM publication standards.
+    if n_bootstrap > 0:
+        samples = bootstrap_metrics(y_true, {}, scores=y_score, n_resamples=n_bootstrap,
+                                    workers=workers, seed=seed)
+        roc_data['auc_ci'] = confidence_interval(samples['scores']['auc'])
     
-    Parameters:
-    results (dict): Dictionary containing model performance metrics
-    roc_data (dict): Dictionary containing ROC curve data
-    output_path (str | None): Base path to save the plots. If None, display instead.
-    """
-    # Set IEEE/ACM compatible settings
+    return roc_data
+
+def set_performance_style():
+    """Set IEEE/ACM compatible plotting parameters for the performance figures."""
     plt.style.use('seaborn-v0_8-whitegrid')
     plt.rcParams.update({
         'font.family': 'Times New Roman',
@@ -177,7 +311,16 @@ def plot_model_performance(results: dict, roc_data: dict, output_path: str | Non
         'grid.linewidth': 0.5
     })
 
-    # Figure 1: Performance Metrics
+def plot_performance_metrics(results: dict, output_path: str | None = None):
+    """
+    Plot the performance metrics of all models as a heatmap.
+    
+    Parameters:
+    results (dict): Dictionary containing model performance metrics
+    output_path (str | None): Base path to save the plot to '<output_path>_metrics.{png,pdf}'.
+        If None, display instead.
+    """
+    set_performance_style()
     fig1, ax1 = plt.subplots(figsize=(3.5, 2.5))  # Column width for IEEE
     
     metrics = ['Accuracy', 'Precision', 'Recall', 'F1-Score']
@@ -204,7 +347,16 @@ def plot_model_performance(results: dict, roc_data: dict, output_path: str | Non
         plt.show()
     plt.close(fig1)
 
-    # Figure 2: ROC Curve
+def plot_roc(roc_data: dict, output_path: str | None = None):
+    """
+    Plot the ROC curve of the proposed model.
+    
+    Parameters:
+    roc_data (dict): Dictionary containing ROC curve data
+    output_path (str | None): Base path to save the plot to '<output_path>_roc.{png,pdf}'.
+        If None, display instead.
+    """
+    set_performance_style()
     fig2, ax2 = plt.subplots(figsize=(3.5, 2.5))  # Column width for IEEE
     
     ax2.plot(roc_data['fpr'], 
@@ -236,18 +388,78 @@ def plot_model_performance(results: dict, roc_data: dict, output_path: str | Non
         plt.show()
     plt.close(fig2)
 
+def plot_model_performance(results: dict, roc_data: dict, output_path: str | None = None):
+    """
+    Plot performance metrics and ROC curve following IEEE/ACM publication standards.
+    
+    Parameters:
+    results (dict): Dictionary containing model performance metrics
+    roc_data (dict): Dictionary containing ROC curve data
+    output_path (str | None): Base path to save the plots. If None, display instead.
+    """
+    plot_performance_metrics(results, output_path)
+    plot_roc(roc_data, output_path)
+
+def evaluate_cached(cache: StageCache, eval_dataset_path: str, model_output_path: str, merged_path: str,
+                    thresholds: tuple = (40, 60), n_bootstrap: int = 1000, seed: int = 0):
+    """
+    Run the merge, metrics and ROC stages, reusing cached results whose inputs and code are unchanged.
+    
+    Parameters:
+    cache (StageCache): Cache of stage results.
+    eval_dataset_path (str): The file path of the evaluation dataset.
+    model_output_path (str): The file path of the model output.
+    merged_path (str): The file path to save the merged dataset.
+    thresholds (tuple): Thresholds of the proposed model.
+    n_bootstrap (int): Number of bootstrap resamples for the confidence intervals.
+    seed (int): Random seed of the bootstrap.
+    
+    Returns:
+    Tuple[pd.DataFrame, dict, dict]: Merged dataset, performance metrics and ROC curve data
+    """
+    merged_data = cache.cached(
+        'merge', [eval_dataset_path, model_output_path], None,
+        lambda: merge_evaluation_with_model_output(eval_dataset_path=eval_dataset_path,
+                                                   model_output_path=model_output_path,
+                                                   output_path=merged_path),
+        outputs=[merged_path, get_pulse_hourly_path(merged_path)], code=STAGE_CODE)
+    
+    results = cache.cached(
+        'metrics', [merged_path], {'thresholds': thresholds, 'n_bootstrap': n_bootstrap, 'seed': seed},
+        lambda: calculate_model_performance(merged_path, thresholds, n_bootstrap=n_bootstrap, seed=seed),
+        code=STAGE_CODE)
+    
+    # Calculate ROC curve data on the merge above instead of merging again
+    roc_data = cache.cached(
+        'roc', [eval_dataset_path, model_output_path], {'n_bootstrap': n_bootstrap, 'seed': seed},
+        lambda: get_roc_curve_data(eval_dataset_path, model_output_path, n_bootstrap=n_bootstrap,
+                                   seed=seed, merged_df=merged_data),
+        code=STAGE_CODE)
+    return merged_data, results, roc_data
+
 if __name__ == "__main__":
-    # Merge evaluation dataset with model output
-    merged_data = merge_evaluation_with_model_output(eval_dataset_path='data/processed/evaluation_dataset.csv',
-                                                    model_output_path='data/processed/weeg_model_output_on_evaluation_dataset.csv',
-                                                    output_path='data/results/evaluation_dataset_with_model_output.csv')
+    parser = argparse.ArgumentParser(description="Evaluate model output against the labelled evaluation dataset.")
+    parser.add_argument('--no-cache', action='store_true', help="Recompute every stage instead of using cached results")
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR), help="Directory of cached stage results")
+    parser.add_argument('--cache-size-mb', type=int, default=DEFAULT_MAX_BYTES >> 20, help="Maximum size of the cache in MB")
+    args = parser.parse_args()
+
+    eval_dataset_path = 'data/processed/evaluation_dataset.csv'
+    model_output_path = 'data/processed/weeg_model_output_on_evaluation_dataset.csv'
+    merged_path = 'data/results/evaluation_dataset_with_model_output.csv'
+    n_bootstrap, seed = 1000, 0
+
+    cache = StageCache(args.cache_dir, args.cache_size_mb << 20)
+    if args.no_cache:
+        cache.clear()
+
+    # Merge evaluation dataset with model output, and calculate the performance metrics and ROC curve data
+    merged_data, results, roc_data = evaluate_cached(cache, eval_dataset_path, model_output_path, merged_path,
+                                                     n_bootstrap=n_bootstrap, seed=seed)
     print(f"Merged dataset shape: {merged_data.shape}")
     print("\nFirst few rows:")
     print(merged_data.head())
     
-    # Calculate and display performance metrics
-    results = calculate_model_performance()
-    
     for model_name, metrics in results.items():
         print(f"\n{model_name}:")
         print("Confusion Matrix:")
@@ -255,16 +467,19 @@ if __name__ == "__main__":
         print(f"Accuracy: {metrics['Accuracy']:.3f}")
         print(f"Precision: {metrics['Precision']:.3f}")
         print(f"Recall: {metrics['Recall']:.3f}")
-        print(f"F1-Score: {metrics['F1-Score']:.3f}")
+        print(f"F1-Score: {metrics['F1-Score']:.3f} "
+              f"(95% CI {metrics['F1-Score CI'][0]:.3f}-{metrics['F1-Score CI'][1]:.3f})")
     
-    # Calculate ROC curve data
-    roc_data = get_roc_curve_data(
-        eval_dataset_path='data/processed/evaluation_dataset.csv',
-        model_output_path='data/processed/weeg_model_output_on_evaluation_dataset.csv'
-    )
+    # Sweep all thresholds of the proposed model and report the best F1 operating point
+    sweep = threshold_sweep(merged_data['label_encoded'], merged_data['score_by_proposed_model'])
+    best = select_operating_point(sweep, metric='f1')
+    print(f"\nBest F1 operating point: t={best['threshold']:g}")
+    print(f"F1-Score: {best['f1']:.3f}, Inspections: {int(best['inspections'])}, "
+          f"FP per 1000 inspections: {best['fp_per_1000']:.0f}")
     
     print(f"\nROC Curve Analysis:")
-    print(f"AUC: {roc_data['auc']:.3f}")
+    print(f"AUC: {roc_data['auc']:.3f} (95% CI {roc_data['auc_ci'][0]:.3f}-{roc_data['auc_ci'][1]:.3f})")
+    print(f"\nStage cache: {cache.hits} hits, {cache.misses} misses")
     
     # Plot and save the results
     plot_model_performance(
@@ -0,0 +1,214 @@
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from pulse_hourly import format_pulse_hourly
+from score_pulse_data import HOURS_PER_DAY, score_hourly
+
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = MINUTES_PER_HOUR * HOURS_PER_DAY
+
+def parse_segment(segment: dict) -> Tuple[int, np.ndarray]:
+    """
+    Parse one {"t": "HH:MM", "d": "1|0|2|"} segment of a MeterReportPulseInfo message.
+
+    Parameters:
+    segment (dict): Segment with a start time and a run of per-minute pulse counts.
+
+    Returns:
+    Tuple[int, np.ndarray]: Start minute of the day and the pulse count of every minute.
+    """
+    hours, minutes = segment['t'].split(':')
+    # Like decode_pulse_matrix, empty and malformed tokens are skipped but still take a minute
+    tokens = segment['d'].replace(' ', '').split('|')
+    if tokens and tokens[-1] == '':
+        tokens.pop()
+    counts = np.array([int(token) if token.isdigit() else 0 for token in tokens], dtype=np.int32)
+    return int(hours) * MINUTES_PER_HOUR + int(minutes), counts
+
+class OnlineLeakScorer:
+    """
+    Incremental per-device leak scorer for pulse messages arriving during the day.
+
+    Every device keeps a fixed-size state: the pulse date being collected, 24 hourly pulse bins
+    and the latest minute reported. A message updates the state in O(segment length), and the
+    current likelihood is score_hourly over the hours closed so far. When a device reports a new
+    date, or when the day is closed, its finished day is scored over all 24 hours, which gives
+    the same result as score_pulse_matrix on the decoded day. Reports arriving after their day
+    was finished are dropped and counted in late_messages, so every device-day is output once.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._rows: Dict[str, int] = {}
+        self._device_ids: List[str] = []
+        self._dates = np.zeros(capacity, dtype=np.int32)            # pulseDate as yymmdd, 0 if none
+        self._hourly = np.zeros((capacity, HOURS_PER_DAY), dtype=np.int32)
+        self._last_minute = np.full(capacity, -1, dtype=np.int16)
+        self._finished: List[Tuple[str, int, np.ndarray]] = []
+        self.late_messages = 0
+
+    def _get_row(self, device_id: str) -> int:
+        """Get the state row of a device, growing the state arrays when full."""
+        row = self._rows.get(device_id)
+        if row is not None:
+            return row
+
+        row = len(self._device_ids)
+        if row == len(self._dates):
+            capacity = 2 * len(self._dates)
+            self._dates = np.resize(self._dates, capacity)
+            self._hourly = np.resize(self._hourly, (capacity, HOURS_PER_DAY))
+            self._last_minute = np.resize(self._last_minute, capacity)
+        self._dates[row] = 0
+        self._hourly[row] = 0
+        self._last_minute[row] = -1
+
+        self._rows[device_id] = row
+        self._device_ids.append(device_id)
+        return row
+
+    def _finish_day(self, row: int):
+        """Move the collected day of a device to the finished days and reset its state."""
+        if self._dates[row]:
+            self._finished.append((self._device_ids[row], int(self._dates[row]), self._hourly[row].copy()))
+        self._dates[row] = 0
+        self._hourly[row] = 0
+        self._last_minute[row] = -1
+
+    def _add_hourly(self, device_id: str, date: str, hourly: np.ndarray, last_minute: int) -> int | None:
+        """
+        Add hourly pulse counts to the day a device is collecting.
+        A report for an earlier day than the one being collected comes after that day was
+        finished and output; it is dropped and counted in late_messages.
+
+        Returns:
+        int | None: State row of the device, or None for a late report.
+        """
+        row = self._get_row(device_id)
+        date = int(date)
+        if date < self._dates[row]:
+            self.late_messages += 1
+            return None
+        if date > self._dates[row]:
+            self._finish_day(row)
+            self._dates[row] = date
+
+        self._hourly[row] += hourly
+        self._last_minute[row] = max(self._last_minute[row], last_minute)
+        return row
+
+    def update(self, device_id: str, date: str, start_minute: int, counts: np.ndarray):
+        """
+        Add a run of per-minute pulse counts to the state of a device.
+
+        Parameters:
+        device_id (str): Device ID.
+        date (str): pulseDate of the run (yymmdd).
+        start_minute (int): Minute of the day of the first count.
+        counts (np.ndarray): Pulse count of every consecutive minute.
+        """
+        # Minutes past midnight are dropped, as in decode_pulse_matrix
+        counts = np.asarray(counts)[:max(MINUTES_PER_DAY - start_minute, 0)]
+        if len(counts) == 0:
+            return
+        minutes = start_minute + np.arange(len(counts))
+        hourly = np.bincount(minutes // MINUTES_PER_HOUR, weights=counts, minlength=HOURS_PER_DAY)
+        self._add_hourly(device_id, date, hourly.astype(np.int32), minutes[-1])
+
+    def update_hourly(self, device_ids: List[str], dates: List[str], hourly: np.ndarray,
+                      last_minutes: np.ndarray) -> np.ndarray:
+        """
+        Add a batch of decoded messages, already aggregated into hourly bins.
+
+        Parameters:
+        device_ids (List[str]): Device ID of every message.
+        dates (List[str]): pulseDate of every message (yymmdd).
+        hourly (np.ndarray): Hourly pulse counts of every message, shape (n, 24).
+        last_minutes (np.ndarray): Last minute of the day every message reports on.
+
+        Returns:
+        np.ndarray: State rows of the devices updated.
+        """
+        # Applied in message order, so a device moving to a new date within the batch finishes
+        # its previous day first
+        rows = {self._add_hourly(device_id, date, message_hourly, last_minute)
+                for device_id, date, message_hourly, last_minute in zip(device_ids, dates, hourly, last_minutes)}
+        rows.discard(None)
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def likelihoods_of(self, rows: np.ndarray) -> pd.DataFrame:
+        """
+        Current leak likelihood of the devices in the given state rows.
+
+        Parameters:
+        rows (np.ndarray): State rows, as returned by update_hourly.
+
+        Returns:
+        pd.DataFrame: 'device_id', 'date' (pulseDate) and 'score_likelihood' per device.
+        """
+        closed_hours = (self._last_minute[rows].astype(np.int32) + 1) // MINUTES_PER_HOUR
+        return pd.DataFrame({
+            'device_id': [self._device_ids[row] for row in rows],
+            'date': self._dates[rows].astype(str),
+            'score_likelihood': score_hourly(self._hourly[rows], closed_hours)
+        })
+
+    def update_message(self, device_id: str, message: str | dict):
+        """
+        Add a MeterReportPulseInfo message to the state of a device.
+
+        Parameters:
+        device_id (str): Device ID.
+        message (str | dict): Message as a JSON string or parsed dict.
+        """
+        if isinstance(message, str):
+            message = json.loads(message)
+        for segment in message.get('data', []):
+            start_minute, counts = parse_segment(segment)
+            self.update(device_id, message['pulseDate'], start_minute, counts)
+
+    def likelihoods(self) -> pd.DataFrame:
+        """
+        Current leak likelihood of every device, scored over the hours closed so far.
+
+        Returns:
+        pd.DataFrame: 'device_id', 'date' (pulseDate) and 'score_likelihood' per device.
+        """
+        return self.likelihoods_of(np.arange(len(self._device_ids)))
+
+    def likelihood(self, device_id: str) -> float:
+        """Current leak likelihood of one device, scored over the hours closed so far."""
+        row = self._rows[device_id]
+        closed_hours = (int(self._last_minute[row]) + 1) // MINUTES_PER_HOUR
+        return float(score_hourly(self._hourly[row:row + 1], closed_hours)[0])
+
+    def close_day(self) -> pd.DataFrame:
+        """
+        Score and return all finished days, closing the days still being collected.
+
+        Returns:
+        pd.DataFrame: Model output with 'device_id', 'date' (YYYY-MM-DD), 'score_likelihood'
+            and 'pulse_hourly', as written by score_pulse_matrix.
+        """
+        for row in range(len(self._device_ids)):
+            self._finish_day(row)
+        return self.pop_finished()
+
+    def pop_finished(self) -> pd.DataFrame:
+        """
+        Score and return the days finished so far because their devices moved on to a new date.
+
+        Returns:
+        pd.DataFrame: Model output with 'device_id', 'date' (YYYY-MM-DD), 'score_likelihood'
+            and 'pulse_hourly', as written by score_pulse_matrix.
+        """
+        finished, self._finished = self._finished, []
+        hourly = np.array([day[2] for day in finished], dtype=np.int32).reshape(-1, HOURS_PER_DAY)
+        dates = pd.Series([f"{day[1]:06d}" for day in finished], dtype=str)
+
+        return pd.DataFrame({
+            'device_id': [day[0] for day in finished],
+            'date': pd.to_datetime(dates, format='%y%m%d').dt.strftime('%Y-%m-%d').to_numpy(),
+            'score_likelihood': score_hourly(hourly),
+            'pulse_hourly': format_pulse_hourly(hourly)
+        })
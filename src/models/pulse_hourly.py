@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+HOURS_PER_DAY = 24
+PULSE_HOURLY_SUFFIX = '.pulse_hourly.npy'
+
+def get_pulse_hourly_path(csv_path: str) -> Path:
+    """Get the .npy sidecar path holding the pulse_hourly array of a model output CSV."""
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.stem + PULSE_HOURLY_SUFFIX)
+
+def format_pulse_hourly(hourly: np.ndarray) -> list:
+    """Format hourly pulse counts the way model outputs store them, e.g. '[2, 1, ..., 2]'."""
+    return [str(row) for row in np.asarray(hourly).tolist()]
+
+def parse_pulse_hourly(pulse_hourly: pd.Series) -> np.ndarray:
+    """
+    Parse the legacy '[2, 1, ..., 2]' text column into an array in one pass.
+
+    Parameters:
+    pulse_hourly (pd.Series): Stringified lists of 24 hourly pulse counts.
+
+    Returns:
+    np.ndarray: int32 array of shape (n, 24); rows with a missing value are -1.
+    """
+    missing = '[' + ', '.join(['-1'] * HOURS_PER_DAY) + ']'
+    text = ' '.join(pulse_hourly.fillna(missing).astype(str))
+    values = text.translate(str.maketrans('[],', '   ')).split()
+    if len(values) != len(pulse_hourly) * HOURS_PER_DAY:
+        raise ValueError(f"pulse_hourly does not hold {HOURS_PER_DAY} values in every row")
+    return np.array(values, dtype=np.int32).reshape(-1, HOURS_PER_DAY)
+
+def save_pulse_hourly(hourly: np.ndarray, csv_path: str) -> Path:
+    """
+    Write the pulse_hourly array of a model output CSV to its .npy sidecar.
+
+    Parameters:
+    hourly (np.ndarray): Hourly pulse counts of shape (n, 24), aligned to the CSV rows.
+    csv_path (str): Path of the model output CSV.
+
+    Returns:
+    Path: Path of the sidecar.
+    """
+    sidecar = get_pulse_hourly_path(csv_path)
+    np.save(sidecar, np.ascontiguousarray(hourly, dtype=np.int32))
+    return sidecar
+
+def load_pulse_hourly(csv_path: str, df: pd.DataFrame | None = None, mmap: bool = True,
+                      rows: np.ndarray | None = None) -> np.ndarray:
+    """
+    Load the pulse_hourly array of a model output CSV.
+
+    The .npy sidecar is memory-mapped when it exists, is not older than the CSV and has one
+    row per CSV row. Otherwise the legacy text column is parsed.
+
+    Parameters:
+    csv_path (str): Path of the model output CSV.
+    df (pd.DataFrame | None): The CSV if already loaded; used for the row count and as the
+        fallback. If None, only the pulse_hourly column is read when needed.
+    mmap (bool): Whether to memory-map the sidecar instead of reading it into memory.
+    rows (np.ndarray | None): Positions of the CSV rows to load. If given, df (when not None)
+        holds just those rows, in the same order.
+
+    Returns:
+    np.ndarray: Hourly pulse counts of shape (n, 24).
+    """
+    sidecar = get_pulse_hourly_path(csv_path)
+    if sidecar.exists() and sidecar.stat().st_mtime >= Path(csv_path).stat().st_mtime:
+        hourly = np.load(sidecar, mmap_mode='r' if mmap else None)
+        if rows is not None:
+            return hourly[rows]
+        if df is None or len(hourly) == len(df):
+            return hourly
+
+    if df is None:
+        df = pd.read_csv(csv_path, usecols=['pulse_hourly'])
+        if rows is not None:
+            df = df.iloc[rows]
+    return parse_pulse_hourly(df['pulse_hourly'])
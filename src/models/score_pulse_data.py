@@ -0,0 +1,110 @@
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'data'))
+from decode_pulse_data import HOURS_PER_DAY, calculate_pulse_hourly, load_pulse_matrix
+from pulse_hourly import format_pulse_hourly, save_pulse_hourly
+
+# The security policy of the logic-based baseline model (docs/review_responses.md) flags gas use
+# that stays within a flow interval for a number of consecutive hours, starting at 5 pulses/hour.
+# Micro-leaks mostly stay below that floor, so the scorer applies the same rule to a lower
+# interval: bottom <= pulses per hour < top for LEAK_DURATION hours.
+LEAK_INTERVAL = (1, 5)
+LEAK_DURATION = 12
+
+def longest_runs(mask: np.ndarray) -> np.ndarray:
+    """
+    Length of the longest run of consecutive True values along the last axis.
+
+    Parameters:
+    mask (np.ndarray): Boolean array of shape (..., hours).
+
+    Returns:
+    np.ndarray: Longest run per row.
+    """
+    counts = np.cumsum(mask, axis=-1)
+    # Subtract the count reached at the last False position to restart every run
+    resets = np.maximum.accumulate(np.where(mask, 0, counts), axis=-1)
+    return (counts - resets).max(axis=-1, initial=0)
+
+def score_hourly(hourly: np.ndarray, n_hours: np.ndarray | int = HOURS_PER_DAY) -> np.ndarray:
+    """
+    Score the leak likelihood of device-days from their hourly pulse counts.
+
+    The score is the fraction of hours with any gas flow (a leak never stops) times the
+    progress of the longest run of hours inside LEAK_INTERVAL towards LEAK_DURATION. Both are
+    computed over the first n_hours hours only.
+
+    Parameters:
+    hourly (np.ndarray): Hourly pulse counts of shape (n, 24).
+    n_hours (np.ndarray | int): Number of observed hours per row, e.g. the hours closed so far
+        during the day. Defaults to the whole day.
+
+    Returns:
+    np.ndarray: Leak likelihood per row in [0, 100], rounded to two decimals.
+    """
+    hourly = np.asarray(hourly)
+    n_hours = np.broadcast_to(np.asarray(n_hours), hourly.shape[:1])
+    observed = np.arange(hourly.shape[1]) < n_hours[:, None]
+
+    # A leak keeps the meter running through every hour
+    occupancy = ((hourly > 0) & observed).sum(axis=1) / np.maximum(n_hours, 1)
+
+    # Steady low flow, as opposed to bursts of appliance use
+    bottom, top = LEAK_INTERVAL
+    in_interval = (hourly >= bottom) & (hourly < top) & observed
+    progress = np.minimum(longest_runs(in_interval) / LEAK_DURATION, 1.0)
+
+    return np.round(100 * occupancy * progress, 2)
+
+def score_pulse_matrix(matrix: np.ndarray, index: pd.DataFrame) -> pd.DataFrame:
+    """
+    Score all device-days of a decoded pulse matrix in one vectorized pass.
+
+    Parameters:
+    matrix (np.ndarray): Pulse matrix of shape (n, 1440).
+    index (pd.DataFrame): Row index with 'device_id_encoded' and 'date' (pulseDate, yymmdd).
+
+    Returns:
+    pd.DataFrame: Model output with 'device_id', 'date' (YYYY-MM-DD), 'score_likelihood' and
+        'pulse_hourly', in the format read by merge_evaluation_with_model_output.
+    """
+    hourly = calculate_pulse_hourly(matrix)
+    return pd.DataFrame({
+        'device_id': index['device_id_encoded'].to_numpy(),
+        'date': pd.to_datetime(index['date'], format='%y%m%d').dt.strftime('%Y-%m-%d').to_numpy(),
+        'score_likelihood': score_hourly(hourly),
+        'pulse_hourly': format_pulse_hourly(hourly)
+    })
+
+def score_pulse_file(pulse_file: str, output_path: str | None = None) -> pd.DataFrame:
+    """
+    Score a pulse matrix file or an extracted pulse CSV.
+
+    Parameters:
+    pulse_file (str): Path to pulse_matrix.npz or pulse_data_for_evaluation.csv.
+    output_path (str | None): The file path to save the scores. If None, skip saving. The
+        hourly pulse counts are also written to a .npy sidecar next to it.
+
+    Returns:
+    pd.DataFrame: Model output, one row per device-day.
+    """
+    matrix, index = load_pulse_matrix(pulse_file)
+    scores = score_pulse_matrix(matrix, index)
+
+    if output_path is not None:
+        scores.to_csv(output_path, index=False)
+        save_pulse_hourly(calculate_pulse_hourly(matrix), output_path)
+
+    return scores
+
+if __name__ == "__main__":
+    pulse_file = 'data/interim/pulse_matrix.npz'
+    if not Path(pulse_file).exists():
+        pulse_file = 'data/processed/pulse_data_for_evaluation.csv'
+
+    scores = score_pulse_file(pulse_file, output_path='data/processed/policy_model_output_on_evaluation_dataset.csv')
+    print(f"Scored device-days: {len(scores)}")
+    print(scores['score_likelihood'].describe())
@@ -0,0 +1,147 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+DEFAULT_CACHE_DIR = Path('data/interim/stage_cache')
+DEFAULT_MAX_BYTES = 1 << 30
+FILE_DIGESTS = 'file_digests.json'
+CACHE_FORMAT = 2  # Version of the cache entry layout; part of every key
+
+class StageCache:
+    """
+    Content-addressed cache of pipeline stage results.
+
+    A result is keyed by the stage name, the SHA-256 of every input file, of the source files
+    of the code computing it and of the stage parameters, and pickled to '<key>.pkl' in the
+    cache directory together with a copy of the files the stage writes. File digests are
+    remembered by (path, size, mtime) so unchanged inputs are not re-hashed. When the cache
+    grows beyond max_bytes, the least recently used results are evicted.
+    """
+
+    def __init__(self, cache_dir: str = str(DEFAULT_CACHE_DIR), max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._digests = self._load_digests()
+
+    def _load_digests(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_dir / FILE_DIGESTS, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_atomic(self, path: Path, data: bytes):
+        """Write a file through a temporary file and rename, so readers never see partial data."""
+        fd, tmp_path = tempfile.mkstemp(dir=Path(path).parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def file_digest(self, path: str) -> str:
+        """SHA-256 of a file's content, reusing the stored digest while size and mtime are unchanged."""
+        path = Path(path).resolve()
+        stat = path.stat()
+        stored = self._digests.get(str(path))
+        if stored and stored['size'] == stat.st_size and stored['mtime_ns'] == stat.st_mtime_ns:
+            return stored['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+
+        self._digests[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        self._write_atomic(self.cache_dir / FILE_DIGESTS, json.dumps(self._digests, indent=2).encode('utf-8'))
+        return digest
+
+    def key(self, stage: str, inputs: List[str], params: Dict[str, Any] | None = None,
+            code: List[str] | None = None) -> str:
+        """Cache key of a stage run on the given input files and parameters by the given source files."""
+        description = {
+            'format': CACHE_FORMAT,
+            'stage': stage,
+            'inputs': [self.file_digest(path) for path in inputs],
+            'code': [self.file_digest(path) for path in code or []],
+            'params': params or {}
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def cached(self, stage: str, inputs: List[str], params: Dict[str, Any] | None, compute: Callable[[], Any],
+               outputs: List[str] | None = None, code: List[str] | None = None) -> Any:
+        """
+        Return the cached result of a stage, or compute and store it.
+
+        Parameters:
+        stage (str): Stage name.
+        inputs (List[str]): Input files the result depends on.
+        params (Dict[str, Any] | None): Parameters the result depends on.
+        compute (Callable[[], Any]): Computes the result on a miss.
+        outputs (List[str] | None): Files the stage writes as a side effect. They are stored
+            with the result, and on a hit every output that is missing or differs from the
+            stored copy is restored, so later stages reading them see this run's files.
+        code (List[str] | None): Source files of the modules computing the result, so that
+            results computed by an earlier version of the code are not reused.
+
+        Returns:
+        Any: The stage result.
+        """
+        result_file = self.cache_dir / f"{self.key(stage, inputs, params, code)}.pkl"
+        if result_file.exists():
+            try:
+                with open(result_file, 'rb') as f:
+                    entry = pickle.load(f)
+                if set(entry['outputs']) == set(outputs or []):
+                    self._restore_outputs(entry['outputs'])
+                    os.utime(result_file)  # Mark as recently used
+                    self.hits += 1
+                    return entry['result']
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+                pass
+
+        self.misses += 1
+        result = compute()
+        entry = {'result': result, 'outputs': {output: self._read_output(output) for output in outputs or []}}
+        self._write_atomic(result_file, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+        return result
+
+    def _read_output(self, path: str) -> Dict[str, Any]:
+        """Content and digest of an output file, as stored in a cache entry."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        return {'sha256': hashlib.sha256(data).hexdigest(), 'data': data}
+
+    def _restore_outputs(self, outputs: Dict[str, Dict[str, Any]]):
+        """Rewrite the output files that are missing or differ from their stored copy."""
+        for path, stored in outputs.items():
+            if not Path(path).exists() or self.file_digest(path) != stored['sha256']:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self._write_atomic(Path(path), stored['data'])
+
+    def evict(self):
+        """Delete the least recently used results until the cache fits in max_bytes."""
+        results = sorted(self.cache_dir.glob('*.pkl'), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in results)
+        for path in results:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        """Delete all cached results."""
+        for path in self.cache_dir.glob('*.pkl'):
+            path.unlink(missing_ok=True)
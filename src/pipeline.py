@@ -0,0 +1,274 @@
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+STATE_FILE = Path('data/interim/pipeline/state.json')
+LOG_DIR = Path('data/interim/pipeline/logs')
+
+class Stage:
+    """
+    A pipeline step: a command run from the repository root, the files it reads and the files
+    it writes. Inputs may be glob patterns. A stage runs after every stage that writes one of
+    its inputs.
+    """
+
+    def __init__(self, name: str, command: List[str], inputs: List[str], outputs: List[str]):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def input_files(self) -> List[Path]:
+        files = []
+        for pattern in self.inputs:
+            if any(char in pattern for char in '*?['):
+                files.extend(sorted(ROOT_DIR.glob(pattern)))
+            else:
+                files.append(ROOT_DIR / pattern)
+        return files
+
+    def output_files(self) -> List[Path]:
+        return [ROOT_DIR / output for output in self.outputs]
+
+def script(path: str, *args: str) -> List[str]:
+    """Command running one of the repository scripts with the current interpreter."""
+    return [sys.executable, path, *args]
+
+STAGES = [
+    Stage('encode_evaluation', script('src/data/encode_evaluation_datast.py'),
+          inputs=['src/data/encode_evaluation_datast.py', 'src/data/utils.py',
+                  'data/raw/report_202401-202404_TP.csv', 'data/raw/report_202401-202404_FP.csv'],
+          outputs=['data/processed/evaluation_dataset.csv', 'data/interim/evaluation_device_dates.csv',
+                   'data/interim/encoding_dicts.json']),
+    Stage('extract_pulse_data', script('src/data/extract_pulse_data.py'),
+          inputs=['src/data/extract_pulse_data.py', 'src/data/utils.py', 'src/data/decode_pulse_data.py',
+                  'src/data/ingest_raw_data.py', 'src/data/index_raw_data.py',
+                  'data/interim/evaluation_device_dates.csv', 'data/interim/encoding_dicts.json',
+                  'data/raw/2024*_*.csv'],
+          outputs=['data/processed/pulse_data_for_evaluation.csv']),
+    Stage('decode_pulse_data', script('src/data/decode_pulse_data.py'),
+          inputs=['src/data/decode_pulse_data.py', 'data/processed/pulse_data_for_evaluation.csv'],
+          outputs=['data/interim/pulse_matrix.npz']),
+    Stage('score_pulse_data', script('src/models/score_pulse_data.py'),
+          inputs=['src/models/score_pulse_data.py', 'src/models/pulse_hourly.py', 'src/data/decode_pulse_data.py',
+                  'data/interim/pulse_matrix.npz'],
+          outputs=['data/processed/policy_model_output_on_evaluation_dataset.csv']),
+    Stage('evaluate', script('src/models/evaluate.py'),
+          inputs=['src/models/evaluate.py', 'src/models/bootstrap.py', 'src/models/pulse_hourly.py',
+                  'src/models/stage_cache.py',
+                  'data/processed/evaluation_dataset.csv',
+                  # The model output and its pulse_hourly sidecar, when there is one
+                  'data/processed/weeg_model_output_on_evaluation_dataset*'],
+          outputs=['data/results/evaluation_dataset_with_model_output.csv',
+                   'docs/figures/model_performance_metrics.pdf', 'docs/figures/model_performance_roc.pdf']),
+    Stage('plot_model_results', script('src/visualization/plot_model_results.py'),
+          inputs=['src/visualization/plot_model_results.py',
+                  'data/results/evaluation_dataset_with_model_output.csv'],
+          outputs=['docs/figures/model_comparison_results.pdf', 'docs/figures/model_comparison_results.png']),
+    Stage('generate_simulated_data', script('src/data/generate_simulated_data.py'),
+          inputs=['src/data/generate_simulated_data.py'],
+          outputs=['data/processed/simulated_flow_data.csv', 'data/processed/simulated_flow_data_seconds.parquet',
+                   'data/processed/simulated_flow_data_minutes.parquet']),
+    Stage('visualize_simulated_data', script('src/visualization/visualize_simulated_data.py'),
+          inputs=['src/visualization/visualize_simulated_data.py', 'src/visualization/decimate.py',
+                  'data/processed/simulated_flow_data_seconds.parquet',
+                  'data/processed/simulated_flow_data_minutes.parquet'],
+          outputs=['docs/figures/pulse_counts.pdf', 'docs/figures/flow_rates_by_event.pdf',
+                   'docs/figures/flow_rates_comparison.pdf']),
+]
+
+def upstream_stages(stages: List[Stage]) -> Dict[str, List[str]]:
+    """Map every stage to the stages writing its inputs."""
+    producers = {}
+    for stage in stages:
+        for output in stage.output_files():
+            producers[output] = stage.name
+
+    dependencies = {}
+    for stage in stages:
+        inputs = [ROOT_DIR / pattern for pattern in stage.inputs]
+        dependencies[stage.name] = sorted({producers[path] for path in inputs if path in producers} - {stage.name})
+    return dependencies
+
+def missing_inputs(stage: Stage) -> List[str]:
+    """Inputs of a stage that do not exist, including glob patterns matching no file."""
+    missing = []
+    for pattern in stage.inputs:
+        if any(char in pattern for char in '*?['):
+            if not any(ROOT_DIR.glob(pattern)):
+                missing.append(pattern)
+        elif not (ROOT_DIR / pattern).exists():
+            missing.append(pattern)
+    return missing
+
+def is_up_to_date(stage: Stage, last_run: Optional[dict]) -> bool:
+    """
+    Whether a stage's outputs are newer than its inputs.
+
+    The outputs are compared with the start of the stage's last successful run when there is
+    one, so outputs left untouched because their content did not change still count as fresh.
+    """
+    outputs = stage.output_files()
+    if not all(output.exists() for output in outputs):
+        return False
+    built = min(output.stat().st_mtime for output in outputs)
+    if last_run is not None and last_run.get('status') == 'ok':
+        built = max(built, last_run['started'])
+    return all(path.stat().st_mtime <= built for path in stage.input_files())
+
+def run_stage(stage: Stage) -> dict:
+    """Run a stage, logging its output to its own file. Runs in a worker thread."""
+    log_file = ROOT_DIR / LOG_DIR / f"{stage.name}.log"
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+
+    started = time.time()
+    with open(log_file, 'w', encoding='utf-8') as log:
+        returncode = subprocess.run(stage.command, cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT).returncode
+    seconds = time.time() - started
+
+    error = None
+    if returncode != 0:
+        error = f"exit code {returncode}"
+    elif missing := [output for output in stage.outputs if not (ROOT_DIR / output).exists()]:
+        error = f"output not written: {missing[0]}"
+    return {'status': 'failed' if error else 'ok', 'started': started, 'seconds': round(seconds, 3),
+            'error': error, 'log': str(LOG_DIR / log_file.name)}
+
+def load_state() -> Dict[str, dict]:
+    try:
+        with open(ROOT_DIR / STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state: Dict[str, dict]):
+    state_file = ROOT_DIR / STATE_FILE
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+def run_pipeline(stages: List[Stage] = STAGES, targets: Optional[List[str]] = None, jobs: int = 1,
+                 force: bool = False, dry_run: bool = False) -> bool:
+    """
+    Run the stages that are out of date, each as soon as the stages it depends on are done.
+
+    Independent stages run concurrently in up to jobs subprocesses. A stage is skipped while
+    its outputs are newer than its inputs; stages depending on a failed stage are not run.
+    Timings of every run are saved to the pipeline state file.
+
+    Parameters:
+    stages (List[Stage]): All pipeline stages.
+    targets (List[str] | None): Stages to bring up to date, with everything they depend on.
+        If None, all stages.
+    jobs (int): Maximum number of stages running at once.
+    force (bool): Run the selected stages even if they are up to date.
+    dry_run (bool): Only print which stages would run.
+
+    Returns:
+    bool: Whether no selected stage failed.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    dependencies = upstream_stages(stages)
+
+    # Select the targets and everything upstream of them
+    selected, pending = set(), list(targets or by_name)
+    while pending:
+        name = pending.pop()
+        if name not in by_name:
+            raise ValueError(f"Unknown stage: {name}")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies[name])
+
+    state = load_state()
+    waiting = {name: set(dependencies[name]) & selected for name in by_name if name in selected}
+    changed = set()  # Stages that ran or would run; in a dry run, their dependents would run too
+    failed = set()
+    running = {}
+
+    def start_ready(executor: ThreadPoolExecutor):
+        while ready := [name for name, deps in waiting.items() if not deps]:
+            for name in ready:
+                del waiting[name]
+                start(name, executor)
+                if name not in running.values():
+                    release(name)
+
+    def start(name: str, executor: ThreadPoolExecutor):
+        stage = by_name[name]
+        upstream = set(dependencies[name])
+        if upstream & failed:
+            failed.add(name)
+            print(f"✗ {name}: skipped, depends on a failed stage")
+        elif (force or upstream & changed) and dry_run:
+            changed.add(name)
+            print(f"Would run {name}: {' '.join(stage.command[1:])}")
+        elif missing := missing_inputs(stage):
+            # Typically raw data that is not available on this machine; dependents use the
+            # existing outputs, if any
+            print(f"- {name}: not run, input not found: {missing[0]}")
+        elif force or not is_up_to_date(stage, state.get(name)):
+            # Upstream stages have finished here, so their outputs' mtimes are current; one
+            # that left its outputs unchanged does not make this stage run
+            changed.add(name)
+            if dry_run:
+                print(f"Would run {name}: {' '.join(stage.command[1:])}")
+            else:
+                print(f"Running {name}...")
+                running[executor.submit(run_stage, stage)] = name
+        else:
+            print(f"✓ {name}: up to date")
+
+    def release(name: str):
+        for deps in waiting.values():
+            deps.discard(name)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        start_ready(executor)
+        while running or waiting:
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    state[name] = result
+                    save_state(state)
+                    if result['status'] == 'ok':
+                        print(f"✓ {name}: {result['seconds']:.1f}s")
+                    else:
+                        failed.add(name)
+                        print(f"✗ {name}: {result['error']} (see {result['log']})")
+                    release(name)
+            start_ready(executor)
+            if waiting and not running:
+                raise ValueError(f"Circular dependency between stages: {', '.join(sorted(waiting))}")
+
+    ran = [name for name in by_name if name in changed and state.get(name, {}).get('status') == 'ok']
+    if ran and not dry_run:
+        print(f"\nTimings (saved to {STATE_FILE}):")
+        for name in ran:
+            print(f"  {name}: {state[name]['seconds']:.1f}s")
+    return not failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the out-of-date stages of the data and evaluation pipeline.")
+    parser.add_argument('targets', nargs='*', help="Stages to bring up to date (default: all)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Maximum number of stages running at once")
+    parser.add_argument('--force', action='store_true', help="Run the selected stages even if they are up to date")
+    parser.add_argument('--dry-run', '-n', action='store_true', help="Only print the stages that would run")
+    parser.add_argument('--list', action='store_true', help="List the stages and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, deps in upstream_stages(STAGES).items():
+            print(f"{name}: {', '.join(deps) or '-'}")
+        sys.exit(0)
+
+    success = run_pipeline(targets=args.targets or None, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    sys.exit(0 if success else 1)
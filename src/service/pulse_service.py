@@ -0,0 +1,298 @@
+import sys
+import abc
+import json
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'data'))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'models'))
+from decode_pulse_data import calculate_pulse_hourly, decode_pulse_matrix, extract_pulse_dates
+from online_scorer import OnlineLeakScorer
+
+# A report is a (device_id, payload) pair, where payload is a MeterReportPulseInfo JSON string
+Report = Tuple[str, str]
+
+# Longest accepted line of a TCP report; a day of per-minute pulse counts takes a few KB
+MAX_LINE_BYTES = 1024 * 1024
+
+class PulseSource(abc.ABC):
+    """Base class of report sources. run() puts reports on the queue until the source is exhausted."""
+
+    @abc.abstractmethod
+    async def run(self, reports: asyncio.Queue):
+        pass
+
+class TcpJsonSource(PulseSource):
+    """
+    Accept line-delimited JSON reports on a TCP socket.
+
+    Every line is an object with a 'device_id' and a 'payload', the MeterReportPulseInfo
+    message as an object or a JSON string. A full report queue stops reading from the
+    connections, so TCP flow control pushes back on the senders. Lines longer than
+    max_line_bytes are skipped and counted as malformed.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, max_line_bytes: int = MAX_LINE_BYTES):
+        self.host = host
+        self.port = port
+        self.max_line_bytes = max_line_bytes
+        self.malformed_lines = 0
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 reports: asyncio.Queue):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Over the stream limit; readline has discarded the buffered part of the line
+                    self.malformed_lines += 1
+                    continue
+                if not line:
+                    break
+                try:
+                    report = json.loads(line)
+                    payload = report['payload']
+                    if not isinstance(payload, str):
+                        payload = json.dumps(payload, separators=(',', ':'))
+                    await reports.put((str(report['device_id']), payload))
+                except (ValueError, KeyError, TypeError):
+                    self.malformed_lines += 1
+        finally:
+            writer.close()
+
+    async def run(self, reports: asyncio.Queue):
+        server = await asyncio.start_server(
+            lambda reader, writer: self._handle_connection(reader, writer, reports), self.host, self.port,
+            limit=self.max_line_bytes)
+        print(f"Listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+class DirectoryTailer(PulseSource):
+    """
+    Watch a directory for newly landed raw export files and read their reports.
+
+    A file is read once its size stops changing between two polls. Files are read in chunks in
+    a thread, and every chunk is queued before the next one is read, so memory stays bounded
+    by the chunk size and the queue size.
+    """
+
+    def __init__(self, directory: str, pattern: str = '*.csv', poll_interval: float = 5.0,
+                 chunk_size: int = 10000, once: bool = False):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.once = once
+        self._seen = set()
+
+    def _landed_files(self, sizes: dict) -> List[Path]:
+        """Files not read yet whose size is unchanged since the last poll."""
+        landed = []
+        for path in sorted(self.directory.glob(self.pattern)):
+            if path in self._seen:
+                continue
+            size = path.stat().st_size
+            if sizes.get(path) == size or self.once:
+                landed.append(path)
+            sizes[path] = size
+        return landed
+
+    async def _read_file(self, path: Path, reports: asyncio.Queue):
+        chunks = pd.read_csv(path, chunksize=self.chunk_size, usecols=['表号', '数据'],
+                             dtype=str, encoding='gbk')
+        n_reports = 0
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            chunk = chunk.dropna()
+            for device_id, payload in zip(chunk['表号'], chunk['数据']):
+                await reports.put((device_id, payload))
+            n_reports += len(chunk)
+        print(f"✓ Read {path.name}: {n_reports} reports")
+
+    async def run(self, reports: asyncio.Queue):
+        sizes = {}
+        while True:
+            for path in self._landed_files(sizes):
+                self._seen.add(path)
+                try:
+                    await self._read_file(path, reports)
+                except Exception as e:
+                    print(f"✗ Error reading {path.name}: {str(e)}")
+            if self.once:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+def decode_batch(device_ids: List[str], payloads: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode a micro-batch of reports into hourly pulse bins. Runs in a worker process.
+
+    Args:
+        device_ids (List[str]): Device ID of every report
+        payloads (List[str]): MeterReportPulseInfo JSON string of every report
+
+    Returns:
+        Tuple: Device IDs, pulseDates (yymmdd), (n, 24) hourly pulse counts and the last
+            reported minute of every report with a pulseDate
+    """
+    payloads = pd.Series(payloads, dtype=object)
+    matrix, last_minutes = decode_pulse_matrix(payloads, return_last_minute=True)
+    dates = extract_pulse_dates(payloads)
+
+    dated = dates.notna().to_numpy()
+    return (list(np.asarray(device_ids, dtype=object)[dated]), dates[dated].to_numpy(),
+            calculate_pulse_hourly(matrix[dated]), last_minutes[dated])
+
+async def batch_reports(reports: asyncio.Queue, batches: asyncio.Queue, batch_size: int, max_delay: float):
+    """
+    Group reports into micro-batches of up to batch_size reports or max_delay seconds.
+    A None report ends the stream; the partial batch is flushed and None is passed on.
+    """
+    loop = asyncio.get_running_loop()
+    finished = False
+    while not finished:
+        report = await reports.get()
+        if report is None:
+            break
+        batch = [report]
+        deadline = loop.time() + max_delay
+
+        while len(batch) < batch_size:
+            # Take what is already queued without waiting
+            if not reports.empty():
+                report = reports.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    report = await asyncio.wait_for(reports.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if report is None:
+                finished = True
+                break
+            batch.append(report)
+
+        await batches.put(batch)
+    await batches.put(None)
+
+class PulseService:
+    """
+    Decode and score pulse reports from pluggable sources in micro-batches.
+
+    Reports flow through bounded queues: sources -> reports -> batcher -> batches -> process
+    pool -> decoded -> scorer. Several batches are decoded at a time, and their results are
+    applied to the online scorer state in arrival order, so per-device updates are never reordered.
+    Whenever a queue is full, its producer waits, which bounds memory under upload bursts.
+    """
+
+    def __init__(self, sources: List[PulseSource], batch_size: int = 2000, max_delay: float = 1.0,
+                 queue_size: int = 20000, workers: int = 1, output_path: Optional[str] = None,
+                 alert_threshold: float = 60):
+        self.sources = sources
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.workers = workers
+        self.output_path = output_path
+        self.alert_threshold = alert_threshold
+        self.scorer = OnlineLeakScorer()
+        self.n_reports = 0
+        self.n_batches = 0
+        self._alerted = set()
+
+    def _write_finished(self, finished: pd.DataFrame):
+        """Append finished device-days to the output file."""
+        if self.output_path is None or finished.empty:
+            return
+        output_path = Path(self.output_path)
+        finished.to_csv(output_path, mode='a', header=not output_path.exists(), index=False)
+
+    def _apply(self, decoded: Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]):
+        """Apply a decoded batch to the scorer state and report new alerts."""
+        device_ids, dates, hourly, last_minutes = decoded
+        rows = self.scorer.update_hourly(device_ids, dates, hourly, last_minutes)
+        self.n_reports += len(device_ids)
+        self.n_batches += 1
+
+        likelihoods = self.scorer.likelihoods_of(rows)
+        alerts = likelihoods[likelihoods['score_likelihood'] >= self.alert_threshold]
+        for device_id, date, score in alerts.itertuples(index=False):
+            if (device_id, date) not in self._alerted:
+                self._alerted.add((device_id, date))
+                print(f"Alert: device {device_id} on {date}, likelihood {score:.2f}")
+
+        self._write_finished(self.scorer.pop_finished())
+
+    async def _decode_batches(self, batches: asyncio.Queue, decoded: asyncio.Queue, executor: ProcessPoolExecutor):
+        """Submit batches to the process pool, queueing their pending results in submission order."""
+        loop = asyncio.get_running_loop()
+        while (batch := await batches.get()) is not None:
+            device_ids, payloads = zip(*batch)
+            await decoded.put(loop.run_in_executor(executor, decode_batch, list(device_ids), list(payloads)))
+        await decoded.put(None)
+
+    async def _apply_batches(self, decoded: asyncio.Queue):
+        """Apply decoded batches as soon as they are ready, oldest first."""
+        while (result := await decoded.get()) is not None:
+            self._apply(await result)
+
+    async def _run_sources(self, reports: asyncio.Queue):
+        await asyncio.gather(*(source.run(reports) for source in self.sources))
+        await reports.put(None)
+
+    async def run(self):
+        """Run until every source is exhausted, then close the days still being collected."""
+        reports = asyncio.Queue(maxsize=self.queue_size)
+        batches = asyncio.Queue(maxsize=self.workers)
+        decoded = asyncio.Queue(maxsize=self.workers)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                await asyncio.gather(
+                    self._run_sources(reports),
+                    batch_reports(reports, batches, self.batch_size, self.max_delay),
+                    self._decode_batches(batches, decoded, executor),
+                    self._apply_batches(decoded)
+                )
+        finally:
+            self._write_finished(self.scorer.close_day())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode and score pulse reports as they arrive.")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP listen address")
+    parser.add_argument('--port', type=int, default=None, help="TCP port for line-delimited JSON reports")
+    parser.add_argument('--watch', default=None, help="Directory to watch for raw export files")
+    parser.add_argument('--pattern', default='*.csv', help="File pattern in the watched directory")
+    parser.add_argument('--once', action='store_true', help="Read the watched directory once and exit")
+    parser.add_argument('--batch-size', type=int, default=2000, help="Maximum reports per micro-batch")
+    parser.add_argument('--max-delay', type=float, default=1.0, help="Maximum seconds a report waits for its batch")
+    parser.add_argument('--queue-size', type=int, default=20000, help="Maximum queued reports")
+    parser.add_argument('--workers', type=int, default=1, help="Number of decoding worker processes")
+    parser.add_argument('--alert-threshold', type=float, default=60, help="Likelihood that raises an alert")
+    parser.add_argument('--output', default='data/results/service_model_output.csv', help="Output file for finished device-days")
+    args = parser.parse_args()
+
+    sources = []
+    if args.port is not None:
+        sources.append(TcpJsonSource(args.host, args.port))
+    if args.watch is not None:
+        sources.append(DirectoryTailer(args.watch, args.pattern, once=args.once))
+    if not sources:
+        parser.error("Specify at least one source with --port or --watch")
+
+    service = PulseService(sources, args.batch_size, args.max_delay, args.queue_size, args.workers,
+                           args.output, args.alert_threshold)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+    print(f"\nReports: {service.n_reports}")
+    print(f"Batches: {service.n_batches}")
+    print(f"Late reports: {service.scorer.late_messages}")
@@ -0,0 +1,219 @@
+import os
+import ast
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Render without a display, in this process and in the workers
+os.environ['MPLBACKEND'] = 'Agg'
+import matplotlib
+matplotlib.use('Agg', force=True)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'models'))
+from stage_cache import StageCache
+
+VISUALIZATION_DIR = Path(__file__).resolve().parent
+MODELS_DIR = VISUALIZATION_DIR.parent / 'models'
+DATA_DIR = VISUALIZATION_DIR.parent / 'data'
+SOURCE_DIRS = (VISUALIZATION_DIR, MODELS_DIR, DATA_DIR)
+MANIFEST_FILE = Path('data/interim/figure_manifest.json')
+
+def find_module(module: str) -> Optional[Path]:
+    """Source file of a repository module imported by name, or None for other modules."""
+    for directory in SOURCE_DIRS:
+        if (directory / f"{module}.py").exists():
+            return directory / f"{module}.py"
+    return None
+
+def module_files(module_file: Path) -> List[Path]:
+    """A module's source file and those of the repository modules it imports, recursively."""
+    files, pending = set(), [module_file]
+    while pending:
+        path = pending.pop()
+        if path in files:
+            continue
+        files.add(path)
+        for node in ast.walk(ast.parse(path.read_text(encoding='utf-8'))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            pending.extend(found for name in names if (found := find_module(name.split('.')[0])))
+    return sorted(files)
+
+class FigureJob:
+    """
+    One figure to render: a plotting function called with keyword arguments, the data files it
+    reads and the files it writes.
+
+    The function is given as 'module:function' and imported in the worker, so jobs stay cheap
+    to send to worker processes. The source files of the module and of the repository modules
+    it imports, directly or not, count as the figure's style; deps adds files the figure
+    depends on that are not imported, such as style sheets.
+    """
+
+    def __init__(self, name: str, function: str, kwargs: Optional[Dict[str, Any]] = None,
+                 sources: Optional[List[str]] = None, outputs: Optional[List[str]] = None,
+                 deps: Optional[List[str]] = None):
+        self.name = name
+        self.function = function
+        self.kwargs = kwargs or {}
+        self.sources = sources or []
+        self.outputs = outputs or []
+        self.deps = deps or []
+
+    def module_file(self) -> Path:
+        module = self.function.split(':')[0]
+        module_file = find_module(module)
+        if module_file is None:
+            raise FileNotFoundError(f"Plotting module not found: {module}")
+        return module_file
+
+    def code_files(self) -> List[Path]:
+        """Source files of the plotting module, its repository imports and the extra deps."""
+        return module_files(self.module_file()) + [Path(dep) for dep in self.deps]
+
+    def digest(self, cache: StageCache) -> str:
+        """Hash of everything the figure depends on: its data, its code and style, and its arguments."""
+        sha256 = hashlib.sha256()
+        sha256.update(json.dumps({
+            'function': self.function,
+            'code': [cache.file_digest(path) for path in self.code_files()],
+            'sources': [cache.file_digest(source) for source in self.sources],
+            'matplotlib': matplotlib.__version__
+        }, sort_keys=True).encode('utf-8'))
+        sha256.update(pickle.dumps(self.kwargs, protocol=4))
+        return sha256.hexdigest()
+
+def use_headless_backend():
+    """Worker initializer: force the non-interactive Agg backend before anything is plotted."""
+    os.environ['MPLBACKEND'] = 'Agg'
+    matplotlib.use('Agg', force=True)
+    sys.path[:0] = [str(VISUALIZATION_DIR), str(MODELS_DIR)]
+
+def render_figure(job: FigureJob) -> str:
+    """Render one figure. Runs in a worker process."""
+    # Workers render several figures; start each from the default style, as a script would
+    matplotlib.rcdefaults()
+    import matplotlib.pyplot as plt
+
+    module, function = job.function.split(':')
+    getattr(importlib.import_module(module), function)(**job.kwargs)
+    plt.close('all')
+    return job.name
+
+def load_manifest() -> Dict[str, dict]:
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest: Dict[str, dict]):
+    MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def build_figures(jobs: List[FigureJob], workers: int = 1, force: bool = False,
+                  cache: Optional[StageCache] = None) -> Dict[str, List[str]]:
+    """
+    Render the figures whose data or style changed since they were last built, in parallel.
+
+    Every figure is rendered in a worker process using the Agg backend. A figure is skipped
+    when its hash matches the manifest of the last build and all its outputs exist.
+
+    Parameters:
+    jobs (List[FigureJob]): Figures to build.
+    workers (int): Number of worker processes.
+    force (bool): Render every figure even if it is unchanged.
+    cache (StageCache | None): Cache whose file digests are reused for hashing the sources.
+
+    Returns:
+    dict: Names of the 'rendered', 'skipped' and 'failed' figures.
+    """
+    cache = cache or StageCache()
+    manifest = load_manifest()
+    summary = {'rendered': [], 'skipped': [], 'failed': []}
+
+    digests, pending = {}, []
+    for job in jobs:
+        digests[job.name] = job.digest(cache)
+        unchanged = manifest.get(job.name, {}).get('digest') == digests[job.name]
+        if unchanged and not force and all(Path(output).exists() for output in job.outputs):
+            summary['skipped'].append(job.name)
+        else:
+            pending.append(job)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_headless_backend) as executor:
+            futures = {executor.submit(render_figure, job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    manifest[job.name] = {'digest': digests[job.name], 'outputs': job.outputs}
+                    save_manifest(manifest)
+                    summary['rendered'].append(job.name)
+                    print(f"✓ {job.name}")
+                except Exception as e:
+                    summary['failed'].append(job.name)
+                    print(f"✗ Error rendering {job.name}: {str(e)}")
+    return summary
+
+def default_jobs(cache: StageCache) -> List[FigureJob]:
+    """The figures of the paper, from the evaluation results and the simulated data."""
+    from evaluate import evaluate_cached
+
+    eval_dataset_path = 'data/processed/evaluation_dataset.csv'
+    model_output_path = 'data/processed/weeg_model_output_on_evaluation_dataset.csv'
+    merged_path = 'data/results/evaluation_dataset_with_model_output.csv'
+    _, results, roc_data = evaluate_cached(cache, eval_dataset_path, model_output_path, merged_path)
+
+    jobs = [
+        FigureJob('model_performance_metrics', 'evaluate:plot_performance_metrics',
+                  {'results': results, 'output_path': 'docs/figures/model_performance'},
+                  outputs=['docs/figures/model_performance_metrics.png', 'docs/figures/model_performance_metrics.pdf']),
+        FigureJob('model_performance_roc', 'evaluate:plot_roc',
+                  {'roc_data': roc_data, 'output_path': 'docs/figures/model_performance'},
+                  outputs=['docs/figures/model_performance_roc.png', 'docs/figures/model_performance_roc.pdf']),
+        FigureJob('model_comparison_results', 'plot_model_results:visualize_model_results',
+                  sources=[merged_path],
+                  outputs=['docs/figures/model_comparison_results.pdf', 'docs/figures/model_comparison_results.png'])
+    ]
+
+    data_prefix = 'data/processed/simulated_flow_data'
+    sources = [f"{data_prefix}_seconds.parquet", f"{data_prefix}_minutes.parquet"]
+    if not all(Path(source).exists() for source in sources):
+        sources = [f"{data_prefix}.csv"]
+    for plot in ('pulse_counts', 'flow_rates_by_event', 'flow_rates_comparison'):
+        jobs.append(FigureJob(plot, 'visualize_simulated_data:render_plot',
+                              {'name': plot, 'data_prefix': data_prefix},
+                              sources=sources, outputs=[f"docs/figures/{plot}.pdf"]))
+    return jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the figures whose data or style changed, in parallel.")
+    parser.add_argument('figures', nargs='*', help="Figures to build (default: all)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--force', action='store_true', help="Render every figure even if it is unchanged")
+    args = parser.parse_args()
+
+    cache = StageCache()
+    jobs = default_jobs(cache)
+    if args.figures:
+        unknown = set(args.figures) - {job.name for job in jobs}
+        if unknown:
+            parser.error(f"Unknown figures: {', '.join(sorted(unknown))}")
+        jobs = [job for job in jobs if job.name in args.figures]
+
+    summary = build_figures(jobs, args.workers, args.force, cache)
+    print(f"\nRendered: {len(summary['rendered'])}, unchanged: {len(summary['skipped'])}, "
+          f"failed: {len(summary['failed'])}")
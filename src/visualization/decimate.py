@@ -0,0 +1,68 @@
+import numpy as np
+from typing import Tuple
+
+# Points kept per bucket: first, minimum, maximum and last (M4 decimation)
+POINTS_PER_BUCKET = 4
+
+def minmax_decimate(x, y, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a line to the first, minimum, maximum and last sample of every bucket.
+
+    With one bucket per pixel column, the decimated line draws the same pixels as the full
+    line: every spike, however short, keeps its extreme sample.
+
+    Parameters:
+    x (array-like): Sample positions, in increasing order.
+    y (array-like): Sample values.
+    n_buckets (int): Number of buckets of consecutive samples, e.g. the axes width in pixels.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The kept samples, in their original order. Lines with at
+        most POINTS_PER_BUCKET samples per bucket are returned unchanged.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(y)
+    if n_buckets < 1 or n <= POINTS_PER_BUCKET * n_buckets:
+        return x, y
+
+    # Equal-sized buckets of consecutive samples; the last bucket is padded by repeating the
+    # last sample, which does not change its minimum or maximum
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.concatenate([y, np.full(n_buckets * size - n, y[-1])]).reshape(n_buckets, size)
+    starts = np.arange(n_buckets) * size
+
+    kept = np.concatenate([
+        starts,
+        starts + padded.argmin(axis=1),
+        starts + padded.argmax(axis=1),
+        np.minimum(starts + size, n) - 1
+    ])
+    kept = np.unique(np.minimum(kept, n - 1))
+    return x[kept], y[kept]
+
+def axes_width_pixels(ax) -> int:
+    """Width of an axes in pixels when saved, from the figure width, the axes position and the dpi."""
+    import matplotlib as mpl
+
+    fig = ax.get_figure()
+    dpi = mpl.rcParams['savefig.dpi']
+    if dpi == 'figure':
+        dpi = fig.dpi
+    return max(int(fig.get_figwidth() * ax.get_position().width * dpi), 1)
+
+def plot_decimated(ax, x, y, step: bool = False, **kwargs):
+    """
+    Plot a line through minmax_decimate, with one bucket per pixel column of the axes.
+
+    Parameters:
+    ax (matplotlib.axes.Axes): Axes to plot on.
+    x, y (array-like): Line samples, x in increasing order.
+    step (bool): Draw with ax.step instead of ax.plot.
+    kwargs: Passed on to ax.plot or ax.step.
+
+    Returns:
+    list: The Line2D objects created.
+    """
+    x, y = minmax_decimate(x, y, axes_width_pixels(ax))
+    return ax.step(x, y, **kwargs) if step else ax.plot(x, y, **kwargs)
@@ -2,6 +2,11 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 
+# Scatter layers with at least this many points are drawn as one image in the PDF. Below it, the
+# vector markers are smaller: the 1,100-point evaluation scatters take 42 KB as vectors, 600 KB
+# rasterized at 300 dpi.
+RASTERIZE_MIN_POINTS = 10000
+
 def set_publication_style():
     """Set the matplotlib parameters for publication-quality figures."""
     rcParams['font.family'] = 'Times New Roman'
@@ -52,7 +57,8 @@ def visualize_model_results():
             c=df['prediction_correct'],
             cmap='bwr',  # Changed colormap for binary data
             alpha=0.7,
-            s=20
+            s=20,
+            rasterized=len(df) >= RASTERIZE_MIN_POINTS
         )
         
         # Add threshold line if applicable
@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
+from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.ticker import MaxNLocator, MultipleLocator
+from decimate import plot_decimated
 
 def setup_plotting_style():
     """Set up the plotting style for publication-quality figures."""
@@ -49,6 +52,12 @@ def setup_plotting_style():
         'figure.constrained_layout.w_pad': 0.1,
     })
 
+def minute_locator(minutes: float):
+    """Major ticks every 10 minutes for short recordings, or about six round ticks for long ones."""
+    if minutes <= 120:
+        return MultipleLocator(10)
+    return MaxNLocator(nbins=6, integer=True)
+
 def plot_pulse_counts(df: pd.DataFrame):
     """Plot pulse counts per minute."""
     fig, ax = plt.subplots()
@@ -68,7 +77,7 @@ def plot_pulse_counts(df: pd.DataFrame):
     
     # Adjust axes
     ax.yaxis.set_major_locator(MaxNLocator(integer=True, nbins=5))
-    ax.xaxis.set_major_locator(MultipleLocator(10))  # Major ticks every 10 minutes
+    ax.xaxis.set_major_locator(minute_locator(df['time_minutes'].max()))
     
     # Remove top and right spines
     ax.spines['top'].set_visible(False)
@@ -87,26 +96,27 @@ def plot_flow_rates_by_event(df: pd.DataFrame):
     """Plot flow rates by event source."""
     fig, ax = plt.subplots()
     
-    # Plot combined flow rate
-    ax.plot(df['time_seconds']/60, df['actual_flow_rate'],
-            color=sns.color_palette("husl")[2],
-            label='Combined',
-            linewidth=1.2)
+    # Plot combined flow rate; lines are decimated to the axes width, so long recordings keep
+    # their spikes without drawing every second
+    plot_decimated(ax, df['time_seconds']/60, df['actual_flow_rate'],
+                   color=sns.color_palette("husl")[2],
+                   label='Combined',
+                   linewidth=1.2)
     
     # Plot individual event rates if available
     if 'event1_rate' in df.columns:
-        ax.plot(df['time_seconds']/60, df['event1_rate'],
-                linestyle='--', color=sns.color_palette("husl")[0],
-                label='Micro-leak',
-                linewidth=1)
-        ax.plot(df['time_seconds']/60, df['event2_rate'],
-                linestyle='--', color=sns.color_palette("husl")[1],
-                label='Gas Stove',
-                linewidth=1)
-        ax.plot(df['time_seconds']/60, df['event3_rate'],
-                linestyle='--', color=sns.color_palette("husl")[3],
-                label='Water Heater',
-                linewidth=1)
+        plot_decimated(ax, df['time_seconds']/60, df['event1_rate'],
+                       linestyle='--', color=sns.color_palette("husl")[0],
+                       label='Micro-leak',
+                       linewidth=1)
+        plot_decimated(ax, df['time_seconds']/60, df['event2_rate'],
+                       linestyle='--', color=sns.color_palette("husl")[1],
+                       label='Gas Stove',
+                       linewidth=1)
+        plot_decimated(ax, df['time_seconds']/60, df['event3_rate'],
+                       linestyle='--', color=sns.color_palette("husl")[3],
+                       label='Water Heater',
+                       linewidth=1)
     
     # Customize the plot
     ax.set_xlabel('Time (min)')
@@ -122,7 +132,7 @@ def plot_flow_rates_by_event(df: pd.DataFrame):
     # Adjust axes
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    ax.xaxis.set_major_locator(MultipleLocator(10))
+    ax.xaxis.set_major_locator(minute_locator(df['time_minutes'].max()))
     
     # Add grid
     ax.grid(True, linestyle='--', alpha=0.3)
@@ -137,20 +147,20 @@ def plot_flow_rates_comparison(df: pd.DataFrame):
     """Plot comparison of actual, observed, and smoothed flow rates."""
     fig, ax = plt.subplots()
     
-    # Plot the three flow rates
-    ax.plot(df['time_seconds'] / 60, df['actual_flow_rate'],
-            color=sns.color_palette("husl")[2],
-            label='Actual',
-            linewidth=1.2)
-    ax.step(df['time_minutes'], df['observed_flow_rate'],
-            where='mid', color=sns.color_palette("husl")[0],
-            label='Observed',
-            linewidth=1)
-    ax.step(df['time_minutes'], df['smoothed_flow_rate'],
-            where='mid', color=sns.color_palette("husl")[1],
-            linestyle='--',
-            label='Smoothed',
-            linewidth=1)
+    # Plot the three flow rates, decimated to the axes width
+    plot_decimated(ax, df['time_seconds'] / 60, df['actual_flow_rate'],
+                   color=sns.color_palette("husl")[2],
+                   label='Actual',
+                   linewidth=1.2)
+    plot_decimated(ax, df['time_minutes'], df['observed_flow_rate'], step=True,
+                   where='mid', color=sns.color_palette("husl")[0],
+                   label='Observed',
+                   linewidth=1)
+    plot_decimated(ax, df['time_minutes'], df['smoothed_flow_rate'], step=True,
+                   where='mid', color=sns.color_palette("husl")[1],
+                   linestyle='--',
+                   label='Smoothed',
+                   linewidth=1)
     
     # Customize the plot
     ax.set_xlabel('Time (min)')
@@ -169,7 +179,7 @@ def plot_flow_rates_comparison(df: pd.DataFrame):
     # Adjust axes
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    ax.xaxis.set_major_locator(MultipleLocator(10))
+    ax.xaxis.set_major_locator(minute_locator(df['time_minutes'].max()))
     
     # Add grid
     ax.grid(True, linestyle='--', alpha=0.3)
@@ -180,6 +190,34 @@ def plot_flow_rates_comparison(df: pd.DataFrame):
                 pad_inches=0.1)
     plt.close()
 
+def load_flow_data(data_prefix: str = 'data/processed/simulated_flow_data') -> pd.DataFrame:
+    """Load simulated flow data, preferring the compact per-second/per-minute tables over the CSV."""
+    seconds_file = Path(f"{data_prefix}_seconds.parquet")
+    minutes_file = Path(f"{data_prefix}_minutes.parquet")
+    if not (seconds_file.exists() and minutes_file.exists()):
+        return pd.read_csv(f"{data_prefix}.csv")
+
+    df = pd.read_parquet(seconds_file, memory_map=True)
+    per_minute = pd.read_parquet(minutes_file, memory_map=True)
+
+    # Broadcast the per-minute values onto the seconds they cover
+    df['time_minutes'] = (df['time_seconds'] // 60 + 1).astype(per_minute['time_minutes'].dtype)
+    rows = np.searchsorted(per_minute['time_minutes'].to_numpy(), df['time_minutes'].to_numpy())
+    for column in per_minute.columns.drop('time_minutes'):
+        df[column] = per_minute[column].to_numpy()[rows]
+    return df
+
+PLOTS = {
+    'pulse_counts': plot_pulse_counts,
+    'flow_rates_by_event': plot_flow_rates_by_event,
+    'flow_rates_comparison': plot_flow_rates_comparison
+}
+
+def render_plot(name: str, data_prefix: str = 'data/processed/simulated_flow_data'):
+    """Render one of the PLOTS from the simulated data files, on its own."""
+    setup_plotting_style()
+    PLOTS[name](load_flow_data(data_prefix))
+
 def generate_all_plots():
     """Generate all plots from the simulated data."""
     try:
@@ -187,13 +225,12 @@ def generate_all_plots():
         setup_plotting_style()
         
         # Read the data
-        df = pd.read_csv('data/processed/simulated_flow_data.csv')
+        df = load_flow_data()
         
         # Generate all plots
         print("Generating plots...")
-        plot_pulse_counts(df)
-        plot_flow_rates_by_event(df)
-        plot_flow_rates_comparison(df)
+        for plot in PLOTS.values():
+            plot(df)
         print("All plots generated successfully!")
         
     except FileNotFoundError:
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'data'))
+from encode_additional_dataset import DataEncoder
+
+ADDRESSES = [
+    '阳光花园2期12栋3单元5层502室',
+    ' 绿地 3号楼2单元',
+    '东区12号楼3楼',        # 号楼 wins over 楼
+    '3栋5楼7号楼',
+    '1期2期801室',          # First number per marker
+    '花园１２室',            # Full-width digits
+    '12室',                 # No community name
+    '   5层',               # Blank community name
+    '无编号地址',
+    '',
+    None,
+]
+
+def test_encode_addresses_matches_per_row(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    addresses = pd.Series(ADDRESSES, dtype=object, index=[7, 7, 3, 2, 1, 0, 5, 5, 9, 8, 6])
+    encoder = DataEncoder()
+
+    components = encoder.encode_address_components(addresses)
+    encoded = encoder.encode_addresses(addresses)
+
+    expected = [encoder.encode_address(address) for address in ADDRESSES]
+    assert components.to_dict('records') == [{column: row[column] for column in components.columns} for row in expected]
+    assert encoded.tolist() == [encoder.encode_to_string(address) if address is not None else 'INVALID_ADDRESS'
+                                for address in ADDRESSES]
+    assert encoded.index.equals(addresses.index)
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'models'))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'data'))
+from online_scorer import OnlineLeakScorer
+
+def segment(start: str, counts: list) -> dict:
+    return {'t': start, 'd': ''.join(f"{count}|" for count in counts)}
+
+def test_late_report_after_rollover_is_output_once():
+    scorer = OnlineLeakScorer()
+    replay = [
+        ('dev-a', {'pulseDate': '240101', 'data': [segment('00:00', [1, 0, 2])]}),
+        ('dev-b', {'pulseDate': '240101', 'data': [segment('12:00', [3, 3])]}),
+        ('dev-a', {'pulseDate': '240102', 'data': [segment('00:00', [1])]}),
+        # Arrives after dev-a rolled over to 240102, so its day 240101 is already finished
+        ('dev-a', {'pulseDate': '240101', 'data': [segment('23:00', [5, 5])]}),
+        ('dev-b', {'pulseDate': '240101', 'data': [segment('13:00', [1])]}),
+    ]
+
+    output = []
+    for device_id, message in replay:
+        scorer.update_message(device_id, message)
+        output.append(scorer.pop_finished())
+    output.append(scorer.close_day())
+
+    rows = [frame for frame in output if not frame.empty]
+    days = [(device_id, date) for frame in rows for device_id, date in zip(frame['device_id'], frame['date'])]
+    assert sorted(days) == [('dev-a', '2024-01-01'), ('dev-a', '2024-01-02'), ('dev-b', '2024-01-01')]
+    assert scorer.late_messages == 1
+
+def test_late_report_in_hourly_batch_is_dropped():
+    scorer = OnlineLeakScorer()
+    hourly = np.ones((3, 24), dtype=np.int32)
+    rows = scorer.update_hourly(['dev-a', 'dev-a', 'dev-a'], ['240101', '240102', '240101'],
+                                hourly, np.array([1439, 59, 1439]))
+
+    assert len(rows) == 1
+    assert scorer.late_messages == 1
+    finished = scorer.close_day()
+    assert finished.groupby(['device_id', 'date']).size().max() == 1
+    assert len(finished) == 2
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'models'))
+from pulse_hourly import format_pulse_hourly, get_pulse_hourly_path, load_pulse_hourly, save_pulse_hourly
+
+def write_model_output(path: Path, hourly: np.ndarray):
+    pd.DataFrame({
+        'device_id': [f'D{i}' for i in range(len(hourly))],
+        'pulse_hourly': format_pulse_hourly(hourly)
+    }).to_csv(path, index=False)
+
+def test_load_selects_rows_with_and_without_sidecar(tmp_path):
+    hourly = np.arange(5 * 24, dtype=np.int32).reshape(5, 24)
+    csv_path = tmp_path / 'model_output.csv'
+    write_model_output(csv_path, hourly)
+    rows = np.array([3, 0, 4])
+
+    # Without a sidecar the text column is parsed, and rows must still be applied
+    assert not get_pulse_hourly_path(csv_path).exists()
+    np.testing.assert_array_equal(load_pulse_hourly(str(csv_path), rows=rows), hourly[rows])
+    np.testing.assert_array_equal(load_pulse_hourly(str(csv_path)), hourly)
+
+    save_pulse_hourly(hourly, str(csv_path))
+    np.testing.assert_array_equal(load_pulse_hourly(str(csv_path), rows=rows), hourly[rows])
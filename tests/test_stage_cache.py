@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'models'))
+from evaluate import calculate_model_performance, evaluate_cached
+from pulse_hourly import format_pulse_hourly
+from stage_cache import StageCache
+
+F1 = 'F1-Score'
+PROPOSED_60 = 'Proposed Model (t=60)'
+
+def write_model_output(path: Path, devices: list, dates: list, scores: np.ndarray):
+    pd.DataFrame({
+        'device_id': devices,
+        'date': dates,
+        'score_likelihood': scores,
+        'pulse_hourly': format_pulse_hourly(np.ones((len(devices), 24), dtype=np.int32))
+    }).to_csv(path, index=False)
+
+def test_model_output_a_b_a_returns_results_of_a(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 200
+    devices = [f"D{i:03d}" for i in range(n)]
+    labels = rng.random(n) < 0.3
+    eval_path = tmp_path / 'evaluation.csv'
+    pd.DataFrame({
+        'device_id_encoded': devices,
+        'date_report': '2024/01/01',
+        'label': np.where(labels, 'LEAKAGE', 'NORMAL')
+    }).to_csv(eval_path, index=False)
+
+    model_path = tmp_path / 'model_output.csv'
+    merged_path = tmp_path / 'merged.csv'
+    # A separates the labels well, B flags almost nothing; the files also differ in size
+    scores_a = np.where(labels, 90.25, 10.25)
+    scores_b = np.where(rng.random(n) < 0.02, 99.0, 1.0)
+    cache = StageCache(str(tmp_path / 'cache'))
+
+    def evaluate(scores: np.ndarray) -> dict:
+        write_model_output(model_path, devices, ['2024-01-01'] * n, scores)
+        _, results, _ = evaluate_cached(cache, str(eval_path), str(model_path), str(merged_path), n_bootstrap=0)
+        return results
+
+    results_a = evaluate(scores_a)
+    results_b = evaluate(scores_b)
+    assert results_b[PROPOSED_60][F1] != results_a[PROPOSED_60][F1]
+
+    hits = cache.hits
+    results = evaluate(scores_a)
+    assert cache.hits > hits
+    assert results[PROPOSED_60][F1] == results_a[PROPOSED_60][F1]
+    # The merged file on disk is the one of this run, not of the previous one
+    assert calculate_model_performance(str(merged_path))[PROPOSED_60][F1] == results_a[PROPOSED_60][F1]
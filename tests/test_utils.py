@@ -0,0 +1,43 @@
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'data'))
+import utils
+from utils import EncodingDictManager
+
+def test_unbatched_codes_are_journalled_and_shared(tmp_path):
+    path = tmp_path / 'encoding_dicts.json'
+    manager = EncodingDictManager(str(path))
+    codes = [manager.get_or_create_encoding('device_id', f"80{i:06d}") for i in range(50)]
+    assert codes == [f"D{i:03d}" for i in range(1, 51)]
+    assert manager.get_or_create_encoding('device_id', ' 80000003 ') == 'D004'
+
+    # New codes go to the journal, not the dictionary file, and other managers replay it
+    assert not path.exists()
+    other = EncodingDictManager(str(path))
+    assert other.get_encoding_dict('device_id') == manager.get_encoding_dict('device_id')
+    assert other.get_or_create_encoding('device_id', 'new') == 'D051'
+    assert manager.get_or_create_encoding('device_id', 'newer') == 'D052'
+
+    manager.flush()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['device_id']) == 52
+    assert not manager.journal_path.exists()
+
+def test_journal_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'COMPACT_MIN_ENTRIES', 10)
+    manager = EncodingDictManager(str(tmp_path / 'encoding_dicts.json'))
+    for i in range(100):
+        manager.get_or_create_encoding('usage', f"U{i}")
+        assert manager._journal_entries < 50
+
+def test_batch_saves_dictionary_file(tmp_path):
+    path = tmp_path / 'encoding_dicts.json'
+    manager = EncodingDictManager(str(path))
+    with manager.batch():
+        for i in range(20):
+            manager.get_or_create_encoding('type', f"T{i}")
+        assert not path.exists()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['type']) == 20